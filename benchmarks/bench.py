@@ -0,0 +1,200 @@
+"""Benchmarks for the hot paths of BowerStatic.
+
+This creates a synthetic ``bower_components`` directory with many
+components and a deep dependency graph, and measures:
+
+* ``startup``: registering the directory with ``Bower.components()``.
+
+* ``include``: including resources with ``Includer.__call__``.
+
+* ``render``: rendering the inclusions with ``Inclusions.render()``.
+
+* ``inject``: the ``InjectorTween`` on a large HTML page.
+
+* ``publish``: serving a resource with the ``PublisherTween``.
+
+For each stage it reports the throughput and latency percentiles. Run
+it with::
+
+  $ python benchmarks/bench.py --components 300 --depth 20
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import webob
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import bowerstatic  # noqa
+from bowerstatic.includer import Includer  # noqa
+
+clock = timeit.default_timer
+
+
+def make_bower_components(path, count, depth, fanout, seed=0):
+    """Make count components in path.
+
+    Component ``c<n>`` depends on the previous component in its chain,
+    so that chains are ``depth`` components deep, and on up to
+    ``fanout`` random earlier components.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        name = 'c%s' % i
+        dependencies = {}
+        if i % depth:
+            dependencies['c%s' % (i - 1)] = '*'
+        for j in range(rng.randint(0, fanout)):
+            if i:
+                dependencies['c%s' % rng.randrange(i)] = '*'
+        component_dir = os.path.join(path, name)
+        os.makedirs(os.path.join(component_dir, 'dist'))
+        with open(os.path.join(component_dir, '.bower.json'), 'w') as f:
+            json.dump({
+                'name': name,
+                'version': '1.0.%s' % i,
+                'main': ['dist/%s.js' % name, 'dist/%s.css' % name],
+                'dependencies': dependencies,
+            }, f)
+        for ext in ['.js', '.css']:
+            with open(os.path.join(component_dir, 'dist', name + ext),
+                      'w') as f:
+                f.write('/* %s%s */\n' % (name, ext) * 100)
+
+
+def measure(func, iterations):
+    timings = []
+    for i in range(iterations):
+        start = clock()
+        func()
+        timings.append(clock() - start)
+    return timings
+
+
+def percentile(timings, p):
+    index = min(len(timings) - 1, int(round(p / 100.0 * (len(timings) - 1))))
+    return timings[index]
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    total = sum(timings)
+    throughput = len(timings) / total if total else float('inf')
+    print('%-8s %8d ops %12.1f ops/s   p50 %9.1fus   p95 %9.1fus   '
+          'p99 %9.1fus' % (
+              name, len(timings), throughput,
+              percentile(timings, 50) * 1e6,
+              percentile(timings, 95) * 1e6,
+              percentile(timings, 99) * 1e6))
+
+
+def run(path, args):
+    bower_components = os.path.join(path, 'bower_components')
+    os.makedirs(bower_components)
+    make_bower_components(bower_components, args.components, args.depth,
+                          args.fanout)
+
+    def startup():
+        bower = bowerstatic.Bower()
+        bower.components('components', bower_components)
+
+    report('startup', measure(startup, args.startup_iterations))
+
+    bower = bowerstatic.Bower()
+    components = bower.components('components', bower_components)
+
+    rng = random.Random(1)
+    pages = [['c%s' % rng.randrange(args.components)
+              for i in range(args.includes)]
+             for j in range(args.pages)]
+
+    def include_page(environ, page):
+        include = Includer(bower, components, environ)
+        for path in page:
+            include(path)
+
+    def include():
+        include_page({}, rng.choice(pages))
+
+    report('include', measure(include, args.iterations))
+
+    environs = []
+    for page in pages:
+        environ = {}
+        include_page(environ, page)
+        environs.append(environ)
+
+    def render():
+        rng.choice(environs)['bowerstatic.inclusions'].render()
+
+    report('render', measure(render, args.iterations))
+
+    body = (b'<html><head><title>Benchmark</title></head><body>' +
+            b'<p>Lorem ipsum dolor sit amet.</p>' *
+            (args.html_size // 33) + b'</body></html>')
+
+    def handler(request):
+        include_page(request.environ, rng.choice(pages))
+        return webob.Response(body=body, content_type='text/html')
+
+    injector = bowerstatic.InjectorTween(bower, handler)
+    streaming_injector = bowerstatic.InjectorTween(bower, handler,
+                                                   streaming=True)
+
+    def inject():
+        injector(webob.Request.blank('/')).body
+
+    def inject_streaming():
+        streaming_injector(webob.Request.blank('/')).body
+
+    report('inject', measure(inject, args.iterations))
+    report('stream', measure(inject_streaming, args.iterations))
+
+    publisher = bowerstatic.PublisherTween(bower, None)
+    urls = [resource.url()
+            for i in range(args.components)
+            for resource in components.resources('c%s' % i)]
+
+    def publish():
+        request = webob.Request.blank(rng.choice(urls))
+        request.get_response(publisher(request)).body
+
+    report('publish', measure(publish, args.iterations))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths of BowerStatic.")
+    parser.add_argument('--components', type=int, default=300,
+                        help="Amount of components to generate.")
+    parser.add_argument('--depth', type=int, default=20,
+                        help="Length of dependency chains.")
+    parser.add_argument('--fanout', type=int, default=2,
+                        help="Maximum extra dependencies per component.")
+    parser.add_argument('--pages', type=int, default=20,
+                        help="Amount of distinct pages.")
+    parser.add_argument('--includes', type=int, default=10,
+                        help="Amount of includes per page.")
+    parser.add_argument('--html-size', type=int, default=200000,
+                        help="Size of the HTML body in bytes.")
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help="Iterations per stage.")
+    parser.add_argument('--startup-iterations', type=int, default=10,
+                        help="Iterations for the startup stage.")
+    args = parser.parse_args(argv)
+    path = tempfile.mkdtemp()
+    try:
+        run(path, args)
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,14 @@
 from .core import Bower
 from .error import Error
 from .autoversion import (filesystem_second_autoversion,
-                          filesystem_microsecond_autoversion)
+                          filesystem_microsecond_autoversion,
+                          content_hash_autoversion,
+                          ExplicitInvalidation, TTLInvalidation,
+                          PollingWatcher)
 from .utility import module_relative_path
 from .publisher import PublisherTween
+from .cache import FileCache, ContentCache, strip_whitespace
+from .compress import Compressor
+from .bundle import Bundler
 from .injector import InjectorTween
 from .renderer import render_inline_js, render_inline_css
@@ -0,0 +1,221 @@
+"""ASGI versions of the publisher and injector.
+
+These use the same ``Bower`` object, and therefore the same components,
+caches and renderers, as the WSGI versions. Files are read in a thread
+so that the event loop is never blocked. This module needs Python 3.5
+or later.
+
+Resources are included the same way as with WSGI, by passing the ASGI
+``scope`` instead of the WSGI ``environ`` to the includer::
+
+  include = components.includer(scope)
+  include('jquery')
+"""
+import asyncio
+import io
+import sys
+import webob
+from .publisher import PublisherTween
+from .injector import CONTENT_TYPES, METHODS, HEAD_END
+
+
+def wrap(bower, app, preload=False):
+    """Wrap an ASGI application with a publisher and an injector.
+    """
+    return Publisher(bower, Injector(bower, app, preload))
+
+
+class Publisher(object):
+    """ASGI middleware that serves the files of components.
+    """
+    def __init__(self, bower, app):
+        self.bower = bower
+        self.app = app
+        self.tween = PublisherTween(bower, None)
+
+    async def __call__(self, scope, receive, send):
+        signature = self.bower.publisher_signature
+        if (scope['type'] != 'http' or
+                published_path(scope['path']) != signature):
+            await self.app(scope, receive, send)
+            return
+        environ = scope_to_environ(scope)
+        loop = asyncio.get_event_loop()
+        status, headers, app_iter = await loop.run_in_executor(
+            None, self.respond, environ)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        iterator = iter(app_iter)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(None, close)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def respond(self, environ):
+        """Serve the request as the WSGI publisher would.
+
+        Returns the status code, the headers and the app_iter.
+        """
+        started = []
+
+        def start_response(status, headerlist, exc_info=None):
+            started.append((status, headerlist))
+
+        response = self.tween(webob.Request(environ))
+        app_iter = response(environ, start_response)
+        status, headerlist = started[0]
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in headerlist]
+        return int(status.split(' ', 1)[0]), headers, app_iter
+
+
+class Injector(object):
+    """ASGI middleware that injects the included resources into HTML.
+
+    The response body is passed on as soon as ``</head>`` has been seen.
+    """
+    def __init__(self, bower, app, preload=False):
+        self.bower = bower
+        self.app = app
+        self.preload = preload
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in METHODS:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive,
+                       InjectingSend(scope, send, self.preload))
+
+
+class InjectingSend(object):
+    """Wraps the ASGI send callable to inject into the response.
+    """
+    def __init__(self, scope, send, preload):
+        self.scope = scope
+        self.send = send
+        self.preload = preload
+        self.passthrough = False
+        self.start = None
+        self.snippet = None
+        self.buffered = []
+        self.tail = b''
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+        elif message['type'] == 'http.response.start':
+            await self.response_start(message)
+        elif message['type'] == 'http.response.body':
+            await self.response_body(message)
+        else:
+            await self.send(message)
+
+    async def response_start(self, message):
+        inclusions = self.scope.get('bowerstatic.inclusions')
+        headers = list(message.get('headers', []))
+        if (inclusions is None or
+                get_content_type(headers) not in CONTENT_TYPES):
+            self.passthrough = True
+            await self.send(message)
+            return
+        sorted_inclusions = inclusions.get_sorted()
+        self.snippet = sorted_inclusions.html().encode('utf-8')
+        if self.preload:
+            link_header = sorted_inclusions.link_header()
+            if link_header:
+                headers.append((b'link', link_header.encode('latin-1')))
+        # hold back the start until we know the content length
+        self.start = dict(message, headers=headers)
+
+    async def response_body(self, message):
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        self.buffered.append(body)
+        # the end tag may be split over messages
+        window = self.tail + body
+        if HEAD_END not in window and more_body:
+            self.tail = window[-(len(HEAD_END) - 1):]
+            return
+        data = b''.join(self.buffered)
+        index = data.find(HEAD_END)
+        if index != -1:
+            data = data[:index] + self.snippet + data[index:]
+            self.start['headers'] = adjust_content_length(
+                self.start['headers'], len(self.snippet))
+        self.passthrough = True
+        await self.send(self.start)
+        await self.send({
+            'type': 'http.response.body',
+            'body': data,
+            'more_body': more_body,
+        })
+
+
+def published_path(path):
+    """The first segment of path."""
+    return path.lstrip('/').split('/', 1)[0]
+
+
+def get_content_type(headers):
+    for name, value in headers:
+        if name.lower() == b'content-type':
+            return value.split(b';', 1)[0].strip().lower().decode('latin-1')
+    return None
+
+
+def adjust_content_length(headers, extra):
+    result = []
+    for name, value in headers:
+        if name.lower() == b'content-length':
+            value = str(int(value) + extra).encode('latin-1')
+        result.append((name, value))
+    return result
+
+
+def scope_to_environ(scope):
+    """A WSGI environ for an ASGI HTTP scope without a request body.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings are bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
@@ -1,5 +1,10 @@
 from datetime import datetime
+import hashlib
 import os
+from stat import S_ISREG
+import threading
+import time
+from .cache import LRUCache
 
 
 VCS_NAMES = ['.svn', '.git', '.bzr', '.hg']
@@ -56,3 +61,191 @@ def filesystem_second_autoversion(path):
     result = get_latest_filesystem_datetime(path)
     result = result.replace(microsecond=0)
     return result.isoformat()
+
+
+# for how many files to remember the digest of their content
+CONTENT_HASH_CACHE_SIZE = 16384
+
+# digests of file contents, with the stat information they were computed for
+_content_hashes = LRUCache(CONTENT_HASH_CACHE_SIZE)
+
+BLOCK_SIZE = 64 * 1024
+
+
+def get_content_hash(path, stat):
+    key = stat.st_mtime, stat.st_size, stat.st_ino
+    entry = _content_hashes.get(path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(BLOCK_SIZE)
+            if not data:
+                break
+            h.update(data)
+    digest = h.digest()
+    _content_hashes.set(path, (key, digest))
+    return digest
+
+
+def content_hash_autoversion(path):
+    """Hash of the content of all files.
+
+    The version only changes if the content of a file changes, or if
+    files are added, removed or renamed. It does not change if a file is
+    only touched, and it is the same on different machines for the same
+    content. Files are only hashed again if their modification time,
+    size or inode changed since they were last hashed.
+    """
+    h = hashlib.sha1()
+    for filename in sorted(list_directory(
+            path,
+            ignore_directories=VCS_NAMES,
+            ignore_extensions=IGNORE_EXTENSIONS)):
+        stat = os.stat(filename)
+        if not S_ISREG(stat.st_mode):
+            continue
+        relative = os.path.relpath(filename, path).replace(os.sep, '/')
+        h.update(relative.encode('utf-8'))
+        h.update(b'\0')
+        h.update(get_content_hash(filename, stat))
+    return h.hexdigest()[:16]
+
+
+class ExplicitInvalidation(object):
+    """Cached versions stay valid until ``Bower.invalidate`` is called.
+    """
+    def watch(self, cache, path):
+        pass
+
+    def valid(self, path, computed):
+        return True
+
+    def stop(self):
+        pass
+
+
+class TTLInvalidation(ExplicitInvalidation):
+    """Cached versions stay valid for ``ttl`` seconds.
+
+    ``Bower.invalidate`` can still be used to expire them earlier.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def valid(self, path, computed):
+        return time.time() - computed < self.ttl
+
+
+def get_snapshot(path):
+    """The modification time and size of everything in path.
+    """
+    result = {}
+    for path in list_directory(
+            path,
+            ignore_directories=VCS_NAMES,
+            ignore_extensions=IGNORE_EXTENSIONS):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        result[path] = stat.st_mtime, stat.st_size
+    return result
+
+
+class PollingWatcher(ExplicitInvalidation):
+    """Watches local components for changes in a background thread.
+
+    Every ``interval`` seconds the thread compares the modification
+    times and sizes of the files in each watched component with the
+    previous time, and computes the version again only for components
+    that changed. Requests therefore never have to look at the
+    filesystem to get the version. ``Bower.close`` stops the thread.
+    """
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def watch(self, cache, path):
+        snapshot = get_snapshot(path)
+        with self._lock:
+            self._watched[path] = cache, snapshot
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Refresh the versions of the components that changed.
+        """
+        with self._lock:
+            watched = list(self._watched.items())
+        for path, (cache, snapshot) in watched:
+            new_snapshot = get_snapshot(path)
+            if new_snapshot == snapshot:
+                continue
+            with self._lock:
+                self._watched[path] = cache, new_snapshot
+            cache.refresh(path)
+
+    def stop(self):
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+class AutoversionCache(object):
+    """Remembers autoversion results per path.
+
+    ``invalidation`` is a strategy object that decides whether a cached
+    version can still be used. It has a ``valid(path, computed)`` method
+    that gets the time the version was computed, and a ``watch(cache,
+    path)`` method that is called when a path is first cached, so that
+    a strategy that watches the filesystem can call ``invalidate`` on
+    the cache itself. If ``invalidation`` is ``None`` nothing is cached.
+    """
+    def __init__(self, autoversion, invalidation=None):
+        self.autoversion = autoversion
+        self.invalidation = invalidation
+        self._versions = {}
+
+    def __call__(self, path):
+        if self.invalidation is None:
+            return self.autoversion(path)
+        entry = self._versions.get(path)
+        if entry is not None:
+            version, computed = entry
+            if self.invalidation.valid(path, computed):
+                return version
+        version = self.autoversion(path)
+        self._versions[path] = version, time.time()
+        if entry is None:
+            self.invalidation.watch(self, path)
+        return version
+
+    def refresh(self, path):
+        """Compute the version for path again.
+        """
+        self._versions[path] = self.autoversion(path), time.time()
+
+    def invalidate(self, path=None):
+        # a file may have changed without changing its stat information,
+        # so also forget the content hashes
+        if path is None:
+            self._versions.clear()
+            _content_hashes.clear()
+            return
+        self._versions.pop(path, None)
+        prefix = os.path.join(path, '')
+        for filename in _content_hashes.keys():
+            if filename.startswith(prefix):
+                _content_hashes.remove(filename)
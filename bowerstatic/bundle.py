@@ -0,0 +1,173 @@
+import hashlib
+import os
+import posixpath
+import re
+import time
+import weakref
+from .cache import LRUCache, CachedFile
+from .utility import write_atomic
+
+# the name used in the URL instead of a components name
+BUNDLE_NAME = '_bundle'
+
+# how many bundles to remember the names and parts of
+BUNDLES_SIZE = 1024
+
+SEPARATORS = {
+    '.js': b'\n;\n',
+    '.css': b'\n',
+}
+
+CSS_URL = re.compile(br'''url\(\s*(['"]?)([^'")\s]+)\1\s*\)''')
+
+ABSOLUTE_URL = re.compile(br'^([a-zA-Z][a-zA-Z0-9+.-]*:|/|#)')
+
+
+def rewrite_css_urls(body, url):
+    """Make relative url() references in CSS relative to the site root.
+
+    This way they keep working when the CSS is served from the bundle URL
+    instead of its own URL.
+    """
+    base = posixpath.dirname(url).encode('utf-8')
+
+    def rewrite(match):
+        quote, target = match.group(1), match.group(2)
+        if ABSOLUTE_URL.match(target):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(base, target))
+        return b'url(' + quote + target + quote + b')'
+    return CSS_URL.sub(rewrite, body)
+
+
+class Bundler(object):
+    """Concatenates resources per extension into bundles.
+
+    Bundles are kept in memory up to ``max_size`` bytes; a bundle that is
+    forgotten is concatenated again when requested, as long as it is
+    one of the ``max_bundles`` most recently used or rendered HTML that
+    is remembered still refers to it. If ``cache_dir`` is
+    given bundles are also written there, so that processes sharing the
+    directory can serve each other's bundles.
+    """
+    def __init__(self, extensions=('.js', '.css'), cache_dir=None,
+                 max_size=16 * 1024 * 1024, max_bundles=BUNDLES_SIZE):
+        self.extensions = set(extensions)
+        self.cache_dir = cache_dir
+        self._cache = LRUCache(max_size=max_size)
+        self._names = LRUCache(max_bundles)
+        self._parts = LRUCache(max_bundles)
+        # name to Bundle objects that are still referred to
+        self._in_use = weakref.WeakValueDictionary()
+
+    def bundle(self, ext, resources):
+        """Get the name of the bundle for resources, creating it if needed.
+
+        The name is based on the content of the bundle.
+        """
+        key = tuple(resource.url() for resource in resources)
+        name = self._names.get(key)
+        if name is not None:
+            return name
+        parts = bundle_parts(resources)
+        body = self.concatenate(ext, parts)
+        name = hashlib.sha1(body).hexdigest()[:16] + ext
+        self._parts.set(name, parts)
+        self._names.set(key, name)
+        self.store(name, body)
+        return name
+
+    def concatenate(self, ext, parts):
+        result = []
+        for filename, url in parts:
+            with open(filename, 'rb') as f:
+                body = f.read()
+            if ext == '.css':
+                body = rewrite_css_urls(body, url)
+            result.append(body)
+        return SEPARATORS.get(ext, b'\n').join(result)
+
+    def store(self, name, body):
+        cached = CachedFile(name, body, time.time())
+        self._cache.set(name, cached, cached.size)
+        if self.cache_dir is None:
+            return cached
+        path = os.path.join(self.cache_dir, name)
+        if not os.path.exists(path):
+            write_atomic(path, body)
+        return cached
+
+    def get(self, name):
+        """Get the bundle with name as a ``CachedFile``.
+
+        Returns ``None`` if there is no such bundle.
+        """
+        cached = self._cache.get(name)
+        if cached is not None:
+            return cached
+        parts = self._parts.get(name)
+        if parts is None:
+            bundle = self._in_use.get(name)
+            if bundle is not None:
+                parts = bundle.parts
+        if parts is not None:
+            ext = os.path.splitext(name)[1]
+            return self.store(name, self.concatenate(ext, parts))
+        if self.cache_dir is None or os.path.basename(name) != name:
+            return None
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        cached = CachedFile(name, body, os.path.getmtime(path))
+        self._cache.set(name, cached, cached.size)
+        return cached
+
+    def keep(self, bundle):
+        """Keep bundle available for as long as it is referred to.
+        """
+        self._in_use[bundle.name] = bundle
+
+    def clear(self):
+        self._names.clear()
+        self._parts.clear()
+        self._cache.clear()
+
+
+def bundle_parts(resources):
+    """The filenames and URLs of the resources in a bundle.
+    """
+    return [(os.path.join(resource.component.path, resource.file_path),
+             resource.url()) for resource in resources]
+
+
+class Bundle(object):
+    """A bundle of resources, which can be rendered like a resource.
+    """
+    def __init__(self, bower, name, resources=None):
+        self.bower = bower
+        self.name = name
+        dummy, self.ext = os.path.splitext(name)
+        if resources is not None:
+            # so that the bundle can be made again as long as this
+            # object is around, such as in rendered inclusions
+            self.parts = bundle_parts(resources)
+            bower.bundler.keep(self)
+
+    def url(self):
+        return '/%s/%s/%s' % (self.bower.publisher_signature, BUNDLE_NAME,
+                              self.name)
+
+    def content(self):
+        return self.bower.bundler.get(self.name).body.decode('utf-8')
+
+    def html(self):
+        return self.bower.renderer(self)(self)
+
+    def links(self):
+        preload_as = self.bower.preload_as(self)
+        if preload_as is None:
+            return []
+        return [(self.url(), preload_as)]
@@ -0,0 +1,223 @@
+from collections import OrderedDict
+import hashlib
+import mimetypes
+import os
+import threading
+
+# for how many files that are too big to cache to remember their size
+OVERSIZE_CACHE_SIZE = 1024
+
+
+class LRUCache(object):
+    """A bounded mapping that forgets the least recently used entries.
+
+    The cache is bounded by the amount of entries, by the total size of
+    the entries, or both. The size of an entry is given when it is set.
+
+    It is safe to share a cache between threads.
+    """
+    def __init__(self, max_entries=None, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value, size
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = value, size
+            self.size += size
+            while self._too_big():
+                dummy, (value, size) = self._entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+
+    def keys(self):
+        """The keys, least recently used first."""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, key):
+        try:
+            value, size = self._entries.pop(key)
+        except KeyError:
+            return
+        self.size -= size
+
+    def _too_big(self):
+        if (self.max_entries is not None and
+                len(self._entries) > self.max_entries):
+            return True
+        return self.max_size is not None and self.size > self.max_size
+
+
+class CachedFile(object):
+    """The contents of a file together with its response headers.
+    """
+    def __init__(self, filename, body, mtime, content_encoding=None):
+        self.filename = filename
+        self.body = body
+        self.size = len(body)
+        self.mtime = mtime
+        self.content_type, guessed_encoding = mimetypes.guess_type(filename)
+        self.content_encoding = content_encoding or guessed_encoding
+        self.etag = hashlib.md5(body).hexdigest()
+
+
+class FileInfo(object):
+    """What the publisher needs to know to answer a conditional request.
+    """
+    __slots__ = ('etag', 'mtime')
+
+    def __init__(self, etag, mtime):
+        self.etag = etag
+        self.mtime = mtime
+
+
+class FileCache(object):
+    """Keeps the contents of published files in memory.
+
+    ``max_size`` is the total amount of bytes kept in memory, files larger
+    than ``max_entry_size`` bytes are never cached. If ``validate`` is
+    true, a cached file is only used if its modification time and size
+    on disk are still the same.
+    """
+    def __init__(self, max_size=16 * 1024 * 1024, max_entry_size=512 * 1024,
+                 validate=True):
+        self.max_entry_size = max_entry_size
+        self.validate = validate
+        self._cache = LRUCache(max_size=max_size)
+        # key to (mtime, size) of files that are too big, so that we
+        # do not open them again only to find that out
+        self._oversize = LRUCache(OVERSIZE_CACHE_SIZE)
+
+    def get(self, key, filename):
+        """Get the cached file for key, loading it from filename if needed.
+
+        Returns ``None`` if the file cannot be cached.
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            if not self.validate:
+                return cached
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                self._cache.remove(key)
+                return None
+            if stat.st_mtime == cached.mtime and stat.st_size == cached.size:
+                return cached
+        oversize = self._oversize.get(key)
+        if oversize is not None:
+            if not self.validate:
+                return None
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                self._oversize.remove(key)
+                return None
+            if (stat.st_mtime, stat.st_size) == oversize:
+                return None
+            self._oversize.remove(key)
+        cached = self.load(key, filename)
+        if cached is not None:
+            self._cache.set(key, cached, cached.size)
+        return cached
+
+    def load(self, key, filename):
+        try:
+            stat = os.stat(filename)
+            if stat.st_size > self.max_entry_size:
+                self._oversize.set(key, (stat.st_mtime, stat.st_size))
+                return None
+            with open(filename, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        return CachedFile(filename, body, stat.st_mtime)
+
+    def clear(self):
+        self._cache.clear()
+        self._oversize.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class ContentCache(object):
+    """Keeps the content of inlined resources in memory.
+
+    Content is remembered for each file and component version, up to a
+    total of ``max_size`` characters. ``filters`` maps an extension to a
+    function that is applied to the content when it is loaded, such as
+    ``strip_whitespace``.
+    """
+    def __init__(self, max_size=1024 * 1024, filters=None):
+        self.filters = filters or {}
+        self._cache = LRUCache(max_size=max_size)
+
+    def get(self, key, ext, load):
+        """Get the content for key, calling load to read it if needed.
+        """
+        content = self._cache.get(key)
+        if content is not None:
+            return content
+        content = load()
+        content_filter = self.filters.get(ext)
+        if content_filter is not None:
+            content = content_filter(content)
+        self._cache.set(key, content, len(content))
+        return content
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def strip_whitespace(content):
+    """Strip whitespace around lines and drop empty lines.
+    """
+    lines = [line.strip() for line in content.splitlines()]
+    return '\n'.join([line for line in lines if line])
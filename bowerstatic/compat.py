@@ -9,10 +9,10 @@ PY3 = sys.version_info[0] == 3
 if PY3:  # pragma: no cover
     text_type = str
 else:
-    text_type = unicode
+    text_type = unicode  # noqa: F821
 
 
 if PY3:
     string_types = (str,)
 else:
-    string_types = (basestring,)
+    string_types = (basestring,)  # noqa: F821
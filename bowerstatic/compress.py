@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+from .cache import LRUCache, CachedFile
+from .utility import write_atomic
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# preferred encodings first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+COMPRESSIBLE_TYPES = set([
+    'application/javascript',
+    'application/json',
+    'application/x-javascript',
+    'application/xml',
+    'image/svg+xml',
+])
+
+
+def encoding_qualities(accept_encoding):
+    """Parse an Accept-Encoding header into a dictionary.
+
+    It maps each acceptable encoding to its quality. ``*`` stands for
+    the encodings we know that are not mentioned explicitly, so an
+    encoding refused with ``q=0`` stays refused.
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        params = part.strip().split(';')
+        encoding = params[0].strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding] = quality
+    star = qualities.get('*')
+    if star is not None:
+        for encoding, ext in ENCODINGS:
+            qualities.setdefault(encoding, star)
+    return dict((encoding, quality)
+                for encoding, quality in qualities.items() if quality > 0)
+
+
+def compressible(filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    if content_type is None or encoding is not None:
+        return False
+    return (content_type.startswith('text/') or
+            content_type in COMPRESSIBLE_TYPES)
+
+
+def compress_gzip(data):
+    f = io.BytesIO()
+    # a fixed mtime so that the result is the same each time
+    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as g:
+        g.write(data)
+    return f.getvalue()
+
+
+def compress_brotli(data):
+    return brotli.compress(data)
+
+
+COMPRESSORS = {'gzip': compress_gzip}
+
+if brotli is not None:  # pragma: no cover
+    COMPRESSORS['br'] = compress_brotli
+
+
+class Compressor(object):
+    """Serves compressed variants of published files.
+
+    Precompressed siblings of a file (``file.js.br``, ``file.js.gz``) are
+    served when the client accepts their encoding. If there are none and
+    ``compress`` is true, the file is compressed on first request. The
+    result is kept in memory, up to ``max_size`` bytes, or in
+    ``cache_dir`` if it is given. Files smaller than ``min_size`` bytes
+    are not compressed on the fly.
+    """
+    def __init__(self, compress=True, cache_dir=None,
+                 max_size=16 * 1024 * 1024, min_size=256):
+        self.compress = compress
+        self.cache_dir = cache_dir
+        self.min_size = min_size
+        self._cache = LRUCache(max_size=max_size)
+        self._siblings = {}
+
+    def compressible(self, filename):
+        return compressible(filename)
+
+    def negotiate(self, accept_encoding, filename):
+        """Find the best compressed variant of a file.
+
+        Returns an ``(encoding, path, cached)`` tuple, where either
+        ``path`` is the filename of the variant on disk or ``cached`` is
+        a ``CachedFile`` with the variant in memory. Returns ``None`` if
+        the file should be served uncompressed.
+        """
+        encoding = self.choose(accept_encoding, filename)
+        if encoding is None:
+            return None
+        return self.variant(filename, encoding)
+
+    def choose(self, accept_encoding, filename):
+        """The encoding to serve filename in, or ``None``.
+        """
+        qualities = encoding_qualities(accept_encoding)
+        if not qualities:
+            return None
+        siblings = self.siblings(filename)
+        # the highest quality wins, then our own preference
+        candidates = [
+            (-qualities[encoding], i, encoding)
+            for i, (encoding, ext) in enumerate(ENCODINGS)
+            if encoding in qualities and (
+                encoding in siblings or
+                (self.compress and encoding in COMPRESSORS))]
+        if not candidates:
+            return None
+        dummy, dummy, encoding = min(candidates)
+        return encoding
+
+    def variant(self, filename, encoding):
+        """The variant of filename in encoding, as ``negotiate`` returns it.
+        """
+        siblings = self.siblings(filename)
+        if encoding in siblings:
+            return encoding, siblings[encoding], None
+        return self.compressed(filename, encoding)
+
+    def siblings(self, filename):
+        result = self._siblings.get(filename)
+        if result is not None:
+            return result
+        result = {}
+        for encoding, ext in ENCODINGS:
+            if os.path.isfile(filename + ext):
+                result[encoding] = filename + ext
+        self._siblings[filename] = result
+        return result
+
+    def compressed(self, filename, encoding):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        if stat.st_size < self.min_size:
+            return None
+        key = filename, stat.st_mtime, stat.st_size, encoding
+        if self.cache_dir is not None:
+            return encoding, self.compressed_path(key), None
+        cached = self._cache.get(key)
+        if cached is None:
+            with open(filename, 'rb') as f:
+                data = COMPRESSORS[encoding](f.read())
+            cached = CachedFile(filename, data, stat.st_mtime, encoding)
+            self._cache.set(key, cached, cached.size)
+        return encoding, None, cached
+
+    def compressed_path(self, key):
+        filename, mtime, size, encoding = key
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        path = os.path.join(self.cache_dir, name + dict(ENCODINGS)[encoding])
+        if os.path.exists(path):
+            return path
+        with open(filename, 'rb') as f:
+            data = COMPRESSORS[encoding](f.read())
+        write_atomic(path, data)
+        return path
+
+    def clear(self):
+        self._cache.clear()
+        self._siblings.clear()
@@ -1,83 +1,236 @@
 import os
 import json
+import threading
+from multiprocessing.pool import ThreadPool
 from . import compat
 from .publisher import Publisher
 from .injector import Injector
-from .includer import Includer
-from .autoversion import filesystem_second_autoversion
+from .toposort import topological_sort
+from .includer import Includer, IncludeSet
+from .autoversion import filesystem_second_autoversion, AutoversionCache
 from .error import Error
 from .renderer import Renderer
+from .cache import LRUCache
+from .export import export
+from .bundle import BUNDLE_NAME
+from .index import read_index, write_index, list_component_directories
+
+
+# how many paths without a component to remember per collection
+MISSING_CACHE_SIZE = 1024
+
+# for how many published files to remember their ETag and mtime
+FILE_INFO_CACHE_SIZE = 4096
+
+MODES = ('development', 'production')
 
 
 class Bower(object):
     """Contains a bunch of bower_components directories.
     """
-    def __init__(self, publisher_signature='bowerstatic', autoversion=None):
+    def __init__(self, publisher_signature='bowerstatic', autoversion=None,
+                 autoversion_invalidation=None, inclusions_cache_size=256,
+                 file_cache=None, compressor=None, bundler=None,
+                 content_cache=None, mode='development'):
+        if mode not in MODES:
+            raise Error("Unknown mode: %s" % mode)
         self.publisher_signature = publisher_signature
+        self.mode = mode
         self._component_collections = {}
         self._renderer = Renderer()
         self.autoversion = autoversion or filesystem_second_autoversion
-
-    def components(self, name, path):
+        self._autoversion_cache = AutoversionCache(self.autoversion,
+                                                   autoversion_invalidation)
+        if inclusions_cache_size:
+            self._inclusions_cache = LRUCache(inclusions_cache_size)
+        else:
+            self._inclusions_cache = None
+        self.file_cache = file_cache
+        self.compressor = compressor
+        self.bundler = bundler
+        self.content_cache = content_cache
+        # (components name, component name, version) to component
+        self._routes = {}
+        self._file_info = LRUCache(FILE_INFO_CACHE_SIZE)
+        # changes when components are added, so that the dependency
+        # closures of resources are computed again
+        self._generation = 0
+
+    def components(self, name, path, index=None, lazy=False, threads=None):
         if name in self._component_collections:
             raise Error("Duplicate name for components directory: %s" % name)
-        result = ComponentCollection(self, name, path=path)
+        if name == BUNDLE_NAME:
+            raise Error("Reserved name for components directory: %s" % name)
+        result = ComponentCollection(self, name, path=path, index=index,
+                                     lazy=lazy, threads=threads)
         self._component_collections[name] = result
         return result
 
     def local_components(self, name, component_collection):
         if name in self._component_collections:
             raise Error("Duplicate name for local components: %s" % name)
+        if name == BUNDLE_NAME:
+            raise Error("Reserved name for local components: %s" % name)
         result = ComponentCollection(self, name,
                                      fallback_collection=component_collection)
         self._component_collections[name] = result
         return result
 
+    def get_autoversion(self, path):
+        return self._autoversion_cache(path)
+
+    def invalidate(self, path=None):
+        """Forget cached information so that it gets recomputed.
+
+        If ``path`` is given, only the cached autoversion for the
+        component in that directory is forgotten, together with the
+        content hashes of its files. As the URLs of its files contain
+        the version, other cached information does not need to be
+        forgotten.
+        """
+        self._autoversion_cache.invalidate(path)
+        if path is not None:
+            return
+        self.dependencies_changed()
+        self._routes.clear()
+        self._file_info.clear()
+        self.reset_include_sets()
+        for component_collection in self._component_collections.values():
+            component_collection._missing.clear()
+        if self._inclusions_cache is not None:
+            self._inclusions_cache.clear()
+        if self.file_cache is not None:
+            self.file_cache.clear()
+        if self.compressor is not None:
+            self.compressor.clear()
+        if self.bundler is not None:
+            self.bundler.clear()
+        if self.content_cache is not None:
+            self.content_cache.clear()
+
+    def close(self):
+        """Stop background work, such as a ``PollingWatcher``.
+        """
+        invalidation = self._autoversion_cache.invalidation
+        if invalidation is not None:
+            invalidation.stop()
+
+    def export(self, target_dir, compress=False, manifest=True):
+        """Export all published files to target_dir.
+
+        See ``bowerstatic.export.export``.
+        """
+        return export(self, target_dir, compress, manifest)
+
     def wrap(self, wsgi):
         return self.publisher(self.injector(wsgi))
 
     def publisher(self, wsgi):
         return Publisher(self, wsgi)
 
-    def injector(self, wsgi):
-        return Injector(self, wsgi)
+    def injector(self, wsgi, streaming=False, preload=False):
+        return Injector(self, wsgi, streaming, preload)
 
-    def register_renderer(self, ext, render_func):
-        self._renderer.register(ext, render_func)
+    def register_renderer(self, ext, render_func, preload_as=None):
+        self._renderer.register(ext, render_func, preload_as)
+        if self._inclusions_cache is not None:
+            self._inclusions_cache.clear()
+        self.reset_include_sets()
+
+    @property
+    def generation(self):
+        """Changes each time the dependencies of resources may change.
+        """
+        return self._generation
+
+    def dependencies_changed(self):
+        self._generation += 1
+
+    def reset_include_sets(self):
+        for component_collection in self._component_collections.values():
+            for include_set in component_collection._include_sets.values():
+                include_set.reset()
 
     def renderer(self, resource):
         return self._renderer.renderer(resource)
 
+    def preload_as(self, resource):
+        return self._renderer.preload_as(resource)
+
     def filter_by_known_ext(self, paths):
         return self._renderer.filter_by_known_ext(paths)
 
     def get_filename(self, bower_components_name,
                      component_name, component_version, file_path):
+        key = (bower_components_name, component_name, component_version)
+        component = self._routes.get(key)
+        if component is None or (component.autoversion and
+                                 component.version != component_version):
+            component = self.route(key)
+            if component is None:
+                return None
+        return component.resolve(file_path)
+
+    def route(self, key):
+        """Look up the component for a URL and remember it.
+
+        Returns ``None`` if there is no such component, or if it has
+        another version.
+        """
+        bower_components_name, component_name, component_version = key
+        self._routes.pop(key, None)
         component_collection = self._component_collections.get(
             bower_components_name)
         if component_collection is None:
             return None
-        return component_collection.get_filename(component_name,
-                                                 component_version,
-                                                 file_path)
+        component = component_collection.get_component(component_name)
+        if component is None or component.version != component_version:
+            return None
+        self._routes[key] = component
+        return component
+
+    def unroute(self, component_name):
+        """Forget the routes to components named component_name.
+        """
+        if not self._routes:
+            return
+        for key in list(self._routes.keys()):
+            if key[1] == component_name:
+                self._routes.pop(key, None)
 
 
 class ComponentCollection(object):
-    def __init__(self, bower, name, path=None, fallback_collection=None):
+    def __init__(self, bower, name, path=None, fallback_collection=None,
+                 index=None, lazy=False, threads=None):
         self.bower = bower
+        self.threads = threads
+        # files known to exist, found while loading in threads
+        self._existing = set()
         self.name = name
         self._resources = {}
         self.path = path
         self.fallback_collection = fallback_collection
+        self.index = index
+        self._include_sets = {}
+        # paths for which no component was found
+        self._missing = LRUCache(MISSING_CACHE_SIZE)
+        # component name to (path, data) for components not loaded yet
+        self._unloaded = {}
+        self._load_lock = threading.RLock()
         if path is not None:
-            self._components = self.load_components(path)
+            self._components = self.load_components(path, lazy)
         else:
             self._components = {}
-        for component in self._components.values():
+        for component in list(self._components.values()):
             self.create_main_resources(component)
+        self._existing.clear()
 
     def add(self, component):
         self._components[component.name] = component
+        self._missing.clear()
+        # this component may hide one served before
+        self.bower.unroute(component.name)
+        self.bower.dependencies_changed()
         self.create_main_resources(component)
 
     def component(self, path, version):
@@ -87,22 +240,119 @@ class ComponentCollection(object):
         self.add(component)
         return component
 
-    def load_components(self, path):
+    def load_components(self, path, lazy=False):
+        index = None
+        if self.index is not None:
+            index = read_index(self.index, path)
+        if index is not None:
+            indexed = index['components']
+        else:
+            indexed = {}
+        mtime = os.path.getmtime(path)
+        if index is not None and index['mtime'] == mtime:
+            component_paths = sorted(indexed.keys())
+        else:
+            component_paths = list_component_directories(path)
         result = {}
-        for component_path in os.listdir(path):
-            if component_path.startswith('.'):
-                continue
-            fullpath = os.path.join(path, component_path)
-            if not os.path.isdir(fullpath):
-                continue
-            component = self.load_component(fullpath, '.bower.json')
-            if component is None:
+        entries = {}
+        loaded = self.map(
+            lambda component_path: self.read_component_entry(
+                path, component_path, indexed.get(component_path), lazy),
+            component_paths)
+        for component_path, (fullpath, entry, data, existing) in zip(
+                component_paths, loaded):
+            self._existing.update(existing)
+            if entry is not None:
+                entries[component_path] = entry
+                component_name = data['name']
+            elif data is None:
+                # without an index we assume the directory name is the
+                # component name, until proven otherwise
+                component_name = component_path
+            else:
+                component_name = data['name']
+            if lazy:
+                self._unloaded[component_name] = fullpath, data
                 continue
+            component = self.make_component(fullpath, data)
             result[component.name] = component
+        if self.index is not None and (index is None or
+                                       index['mtime'] != mtime or
+                                       entries != indexed):
+            write_index(self.index, path, mtime, entries)
         return result
 
+    def read_component_entry(self, path, component_path, entry, lazy):
+        """Read what is needed to load the component in component_path.
+
+        Returns the full path, the index entry, the component data and
+        the main files that were found to exist.
+        """
+        fullpath = os.path.join(path, component_path)
+        if self.index is not None:
+            component_mtime = os.path.getmtime(fullpath)
+            if entry is None or entry['mtime'] != component_mtime:
+                entry = {
+                    'mtime': component_mtime,
+                    'data': self.read_component_data(fullpath,
+                                                     '.bower.json')}
+            data = entry['data']
+        elif lazy:
+            data = None
+        else:
+            data = self.read_component_data(fullpath, '.bower.json')
+        existing = []
+        if self.threads and not lazy:
+            # check the main files here, in parallel
+            for file_path in data['main']:
+                for file_path in self.variants(file_path):
+                    full_path = os.path.join(fullpath, file_path)
+                    if os.path.exists(full_path):
+                        existing.append(full_path)
+        return fullpath, entry, data, existing
+
+    def variants(self, file_path):
+        if self.bower.mode == 'production':
+            minified = minified_name(file_path)
+            if minified is not None:
+                return [file_path, minified]
+        return [file_path]
+
+    def map(self, func, items):
+        """Call func for each of items, in threads if configured.
+
+        The results are in the order of items. If calls fail, the
+        exception of the first failing item is raised, just like when
+        the items are handled one by one.
+        """
+        if not self.threads or len(items) < 2:
+            return [func(item) for item in items]
+
+        def call(item):
+            try:
+                return True, func(item)
+            except Exception as e:
+                return False, e
+        pool = ThreadPool(min(self.threads, len(items)))
+        try:
+            results = pool.map(call, items)
+        finally:
+            pool.close()
+            pool.join()
+        for success, value in results:
+            if not success:
+                raise value
+        return [value for success, value in results]
+
+    def file_exists(self, full_path):
+        return full_path in self._existing or os.path.exists(full_path)
+
     def load_component(self, path, bower_filename, version=None,
                        autoversion=False):
+        data = self.read_component_data(path, bower_filename)
+        return self.make_component(path, data, version, autoversion)
+
+    def read_component_data(self, path, bower_filename):
         bower_json_filename = os.path.join(path, bower_filename)
         with open(bower_json_filename, 'r') as f:
             data = json.load(f)
@@ -115,23 +365,71 @@ class ComponentCollection(object):
         dependencies = data.get('dependencies')
         if dependencies is None:
             dependencies = {}
+        version = data.get('_release')
         if not version:
-            version = data.get('_release')
+            version = data.get('version')
+        return {
+            'name': data['name'],
+            'main': main,
+            'dependencies': dependencies,
+            'version': version,
+        }
+
+    def make_component(self, path, data, version=None, autoversion=False):
         if not version:
-            try:
-                version = data['version']
-            except KeyError:
-                raise ValueError('Missing _release and version in {}'.format(
-                    path))
+            version = data['version']
+        if not version:
+            raise ValueError('Missing _release and version in {}'.format(
+                path))
         return Component(self.bower,
                          self,
                          path,
                          data['name'],
                          version,
-                         main,
-                         dependencies,
+                         data['main'],
+                         data['dependencies'],
                          autoversion=autoversion)
 
+    def load_unloaded(self, component_name):
+        """Load a component that was not loaded yet in lazy mode.
+        """
+        with self._load_lock:
+            result = self._components.get(component_name)
+            if result is not None:
+                return result
+            entry = self._unloaded.pop(component_name, None)
+            if entry is None:
+                # the directory name of a component may not be its name,
+                # so load all components we know nothing about yet
+                for name in list(self._unloaded.keys()):
+                    entry = self._unloaded.get(name)
+                    if entry is not None and entry[1] is None:
+                        self.load_unloaded(name)
+                return self._components.get(component_name)
+            return self.load_unloaded_entry(component_name, *entry)
+
+    def all_components(self):
+        """All components in this collection, by name.
+
+        In lazy mode the components that were not loaded yet are loaded.
+        """
+        with self._load_lock:
+            for name in list(self._unloaded.keys()):
+                if name in self._unloaded:
+                    self.load_unloaded(name)
+        return dict(self._components)
+
+    def load_unloaded_entry(self, component_name, path, data):
+        if data is None:
+            data = self.read_component_data(path, '.bower.json')
+        component = self.make_component(path, data)
+        if component.name in self._components:
+            return None
+        self.add(component)
+        if component.name != component_name:
+            return None
+        return component
+
     def create_main_resources(self, component):
         # if the resource was already created, return it
         resources = self.get_resources(component.name)
@@ -145,13 +443,43 @@ class ComponentCollection(object):
     def includer(self, environ):
         return Includer(self.bower, self, environ)
 
+    def include_set(self, name, paths_or_resources, renderer=None):
+        """Register a named set of resources that are often included together.
+
+        The resources and their dependencies are sorted and rendered
+        once, here. Use ``include.set(name)`` to include the set.
+        """
+        if name in self._include_sets:
+            raise Error("Duplicate name for include set: %s" % name)
+        resources = []
+        for path_or_resources in paths_or_resources:
+            found = self.path_to_resources(path_or_resources)
+            if found is None:
+                raise Error("Cannot find component for path: %s" %
+                            path_or_resources)
+            resources.extend(found)
+        result = IncludeSet(self.bower, name, resources, renderer)
+        self._include_sets[name] = result
+        return result
+
+    def get_include_set(self, name):
+        result = self._include_sets.get(name)
+        if result is not None:
+            return result
+        if self.fallback_collection is None:
+            return None
+        return self.fallback_collection.get_include_set(name)
+
     def resources(self, path, dependencies=None):
         resources = self.get_resources(path)
         if resources is not None:
             return resources
+        if path in self._missing:
+            return None
         dependencies = dependencies or []
         result = self.create_resources(path, dependencies)
         if result is None:
+            self._missing.set(path, True)
             return None
         self._resources[path] = result
         return result
@@ -162,6 +490,11 @@ class ComponentCollection(object):
         result = self._resources.get(path)
         if result is not None:
             return result
+        if self._unloaded:
+            self.get_component(path.split('/', 1)[0])
+            result = self._resources.get(path)
+            if result is not None:
+                return result
         if self.fallback_collection is None:
             return None
         return self.fallback_collection.get_resources(path)
@@ -181,6 +514,10 @@ class ComponentCollection(object):
         result = self._components.get(component_name)
         if result is not None:
             return result
+        if self._unloaded:
+            result = self.load_unloaded(component_name)
+            if result is not None:
+                return result
         if self.fallback_collection is None:
             return None
         return self.fallback_collection.get_component(component_name)
@@ -207,7 +544,7 @@ class ComponentCollection(object):
             file_paths = [file_path]
         for file_path in file_paths:
             full_path = os.path.join(component.path, file_path)
-            if not os.path.exists(full_path):
+            if not self.file_exists(full_path):
                 raise Error(
                     "resource path %s - cannot find resource file: %s" %
                     (path, full_path))
@@ -218,6 +555,10 @@ class ComponentCollection(object):
         if info is None:
             return None
         component, file_paths = info
+        if self.bower.mode == 'production':
+            file_paths = [minified_path(component.path, file_path,
+                                        self.file_exists)
+                          for file_path in file_paths]
         dependency_resources = []
         for dependency in dependencies:
             dependency_resources.extend(self.path_to_resources(dependency))
@@ -225,12 +566,40 @@ class ComponentCollection(object):
                 for file_path in file_paths]
 
 
+def minified_path(path, file_path, exists=os.path.exists):
+    """The minified variant of file_path in path, if there is one.
+
+    ``dist/jquery.js`` becomes ``dist/jquery.min.js`` if that file
+    exists.
+    """
+    minified = minified_name(file_path)
+    if minified is not None and exists(os.path.join(path, minified)):
+        return minified
+    return file_path
+
+
+def minified_name(file_path):
+    """The name of the minified variant of file_path.
+
+    Returns ``None`` if file_path is minified already.
+    """
+    base, ext = os.path.splitext(file_path)
+    if base.endswith('.min'):
+        return None
+    return base + '.min' + ext
+
+
 class Component(object):
+    __slots__ = ('bower', 'component_collection', 'path', '_root', 'name',
+                 '_version', 'main', 'dependencies', 'autoversion')
+
     def __init__(self, bower, component_collection,
                  path, name, version, main, dependencies, autoversion):
         self.bower = bower
         self.component_collection = component_collection
         self.path = path
+        # absolute path with a trailing separator, to check file paths
+        self._root = os.path.join(os.path.abspath(path), '')
         self.name = name
         self._version = version
         self.main = main
@@ -241,14 +610,17 @@ class Component(object):
     def version(self):
         if not self.autoversion:
             return self._version
-        return self.bower.autoversion(self.path)
+        return self.bower.get_autoversion(self.path)
 
     def get_filename(self, version, file_path):
         if version != self.version:
             return None
-        filename = os.path.abspath(os.path.join(self.path, file_path))
+        return self.resolve(file_path)
+
+    def resolve(self, file_path):
+        filename = os.path.abspath(os.path.join(self._root, file_path))
         # sanity check to prevent file_path to escape from path
-        if not filename.startswith(self.path):
+        if not filename.startswith(self._root):
             return None
         return filename
 
@@ -278,6 +650,9 @@ class Component(object):
 
 
 class Resource(object):
+    __slots__ = ('component', 'file_path', 'dependencies', 'ext',
+                 '_closure')
+
     def __init__(self, component, file_path, dependencies):
         self.component = component
         if file_path.startswith('./'):
@@ -285,14 +660,35 @@ class Resource(object):
         self.file_path = file_path
         self.dependencies = dependencies
         dummy, self.ext = os.path.splitext(file_path)
+        self._closure = None
 
     def url(self):
         return self.component.url() + self.file_path
 
+    def closure(self):
+        """This resource and all its dependencies, dependencies first.
+
+        This is computed once and remembered until components are added.
+        """
+        generation = self.component.bower.generation
+        closure = self._closure
+        if closure is None or closure[0] != generation:
+            closure = self._closure = generation, topological_sort(
+                [self], lambda resource: resource.dependencies)
+        return closure[1]
+
     def html(self):
         return self.renderer(self)
 
     def content(self):
+        component = self.component
+        content_cache = component.bower.content_cache
+        if content_cache is None:
+            return self.read()
+        key = (component.path, self.file_path, component.version)
+        return content_cache.get(key, self.ext, self.read)
+
+    def read(self):
         with open(self.component.get_filename(
                 self.component.version, self.file_path)) as f:
             return f.read()
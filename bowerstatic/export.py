@@ -0,0 +1,107 @@
+"""Export all published resources to a directory.
+
+This way a web server such as nginx or a CDN can serve them instead of
+the publisher, under exactly the same URLs.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+from .autoversion import list_directory, VCS_NAMES, IGNORE_EXTENSIONS
+from .compress import ENCODINGS, COMPRESSORS, compressible
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def export(bower, target_dir, compress=False, manifest=True):
+    """Copy the files of all components into target_dir.
+
+    Each file ends up at the path of its URL relative to target_dir. If
+    ``compress`` is true, compressed variants are written next to
+    text-based files, unless the component already ships them. If
+    ``manifest`` is true a ``manifest.json`` is written that maps each
+    URL to its size and MD5 hash.
+
+    Returns the manifest as a dictionary.
+    """
+    result = {}
+    for collection_name in sorted(bower._component_collections):
+        collection = bower._component_collections[collection_name]
+        components = collection.all_components()
+        for component_name in sorted(components):
+            export_component(components[component_name], target_dir,
+                             compress, result)
+    if manifest:
+        with open(os.path.join(target_dir, MANIFEST_FILENAME), 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    return result
+
+
+def export_component(component, target_dir, compress, manifest):
+    url = component.url()
+    component_dir = os.path.join(target_dir, *url.strip('/').split('/'))
+    for path in list_directory(component.path,
+                               ignore_directories=VCS_NAMES,
+                               ignore_extensions=IGNORE_EXTENSIONS):
+        if not os.path.isfile(path):
+            continue
+        file_path = os.path.relpath(path, component.path)
+        target = os.path.join(component_dir, file_path)
+        target_parent = os.path.dirname(target)
+        if not os.path.isdir(target_parent):
+            os.makedirs(target_parent)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(target, 'wb') as f:
+            f.write(data)
+        shutil.copystat(path, target)
+        manifest[url + file_path.replace(os.sep, '/')] = {
+            'size': len(data),
+            'md5': hashlib.md5(data).hexdigest(),
+        }
+        if compress and compressible(path):
+            write_compressed(path, target, data)
+
+
+def write_compressed(path, target, data):
+    for encoding, ext in ENCODINGS:
+        if encoding not in COMPRESSORS or os.path.exists(path + ext):
+            continue
+        with open(target + ext, 'wb') as f:
+            f.write(COMPRESSORS[encoding](data))
+
+
+def resolve(name):
+    """Resolve a ``module:attribute`` name to an object.
+    """
+    module_name, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError("Expected module:attribute, got: %s" % name)
+    result = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        result = getattr(result, part)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the resources of a Bower object to a directory.")
+    parser.add_argument(
+        'bower', help="The Bower object to export, as module:attribute.")
+    parser.add_argument(
+        'target_dir', help="The directory to export to.")
+    parser.add_argument(
+        '--compress', action='store_true',
+        help="Also write compressed variants of text-based files.")
+    parser.add_argument(
+        '--no-manifest', action='store_false', dest='manifest',
+        help="Do not write manifest.json.")
+    args = parser.parse_args(argv)
+    # allow modules in the current directory to be found
+    sys.path.insert(0, os.getcwd())
+    bower = resolve(args.bower)
+    manifest = export(bower, args.target_dir, args.compress, args.manifest)
+    print("Exported %s files to %s" % (len(manifest), args.target_dir))
@@ -1,6 +1,8 @@
 from .toposort import topological_sort
 from .error import Error
-from .renderer import make_renderer
+from .renderer import make_renderer, inlines
+from .bundle import Bundle
+from .compat import string_types
 
 
 class Includer(object):
@@ -10,64 +12,369 @@ class Includer(object):
         self.environ = environ
 
     def __call__(self, path_or_resources, renderer=None):
-        resources = self.components_directory.path_to_resources(
-            path_or_resources)
-        if resources is None:
-            raise Error("Cannot find component for path (need restart?): %s" %
-                        path_or_resources)
-        for resource in resources:
-            self.add(ResourceInclusion(resource, renderer))
+        self.many([path_or_resources], renderer)
+
+    def many(self, paths_or_resources, renderer=None):
+        """Include a list of paths or resources at once.
+
+        Resources that are already included are skipped.
+        """
+        inclusions = self.inclusions()
+        path_to_resources = self.components_directory.path_to_resources
+        for path_or_resources in paths_or_resources:
+            resources = path_to_resources(path_or_resources)
+            if resources is None:
+                raise Error(
+                    "Cannot find component for path (need restart?): %s" %
+                    path_or_resources)
+            for resource in resources:
+                inclusions.add(ResourceInclusion(resource, renderer))
+
+    bulk = many
+
+    def set(self, name):
+        """Include the include set registered under name.
+        """
+        include_set = self.components_directory.get_include_set(name)
+        if include_set is None:
+            raise Error("Unknown include set: %s" % name)
+        self.inclusions().add(include_set)
+
+    def inclusions(self):
+        inclusions = self.environ.get('bowerstatic.inclusions')
+        if inclusions is None:
+            inclusions = self.environ['bowerstatic.inclusions'] = Inclusions(
+                self.bower)
+        return inclusions
 
     def add(self, inclusion):
-        inclusions = self.environ.setdefault(
-            'bowerstatic.inclusions', Inclusions())
-        inclusions.add(inclusion)
+        self.inclusions().add(inclusion)
 
 
 class Inclusions(object):
-    def __init__(self):
+    def __init__(self, bower=None):
+        self.bower = bower
         self._inclusions = []
+        self._added = set()
 
     def add(self, inclusion):
+        # an inclusion that is added again would be sorted away anyway
+        if inclusion in self._added:
+            return
+        self._added.add(inclusion)
         self._inclusions.append(inclusion)
 
+    def key(self):
+        """A hashable key for the inclusions in the order they were added.
+        """
+        return tuple(inclusion.key() for inclusion in self._inclusions)
+
+    def sorted(self):
+        # resources in an include set are rendered with the set
+        covered = {}
+        for inclusion in self._inclusions:
+            for member in inclusion.members():
+                if covered.setdefault(member, inclusion) is not inclusion:
+                    # sets that share resources would render them twice,
+                    # so sort the resources of the sets instead
+                    return self.expanded().sorted()
+        if not covered:
+            merged = self.merged()
+            if merged is not None:
+                return SortedInclusions(merged, self.bower)
+            return SortedInclusions(topological_sort(
+                self._inclusions,
+                lambda inclusion: inclusion.dependencies()),
+                self.bower)
+
+        def substitute(inclusion):
+            return covered.get(inclusion, inclusion)
+        return SortedInclusions(topological_sort(
+            [substitute(inclusion) for inclusion in self._inclusions],
+            lambda inclusion: [substitute(dependency) for dependency
+                               in inclusion.dependencies()]),
+            self.bower)
+
+    def expanded(self):
+        """Inclusions with include sets replaced by their resources.
+        """
+        result = Inclusions(self.bower)
+        for inclusion in self._inclusions:
+            for member in inclusion.members() or [inclusion]:
+                result.add(member)
+        return result
+
+    def merged(self):
+        """Merge the dependency closures of the included resources.
+
+        This gives the same order as sorting, without walking the
+        dependencies again. Returns ``None`` if something other than a
+        resource was included.
+        """
+        for inclusion in self._inclusions:
+            if not isinstance(inclusion, ResourceInclusion):
+                return None
+        result = []
+        seen = set()
+        for inclusion in self._inclusions:
+            closure = inclusion.resource.closure()
+            for resource in closure[:-1]:
+                if resource not in seen:
+                    seen.add(resource)
+                    result.append(ResourceInclusion(resource))
+            if inclusion.resource not in seen:
+                seen.add(inclusion.resource)
+                result.append(inclusion)
+        return result
+
+    def get_sorted(self):
+        """The sorted inclusions, from the cache if possible.
+        """
+        cache = self.bower and self.bower._inclusions_cache
+        if cache is None or not self.cacheable():
+            return self.sorted()
+        key = self.key()
+        sorted_inclusions = cache.get(key)
+        if sorted_inclusions is None:
+            sorted_inclusions = self.sorted()
+            cache.set(key, sorted_inclusions)
+        return sorted_inclusions
+
+    def cacheable(self):
+        return all(inclusion.cacheable() for inclusion in self._inclusions)
+
     def render(self):
-        inclusions = topological_sort(
-            self._inclusions, lambda inclusion: inclusion.dependencies())
-        snippets = [inclusion.html() for inclusion in inclusions]
-        return '\n'.join(snippets)
+        return self.get_sorted().html()
+
+    def link_header(self):
+        return self.get_sorted().link_header()
+
+
+class SortedInclusions(object):
+    """Inclusions in dependency order.
+
+    The rendered HTML is remembered, and only rendered again when the
+    version of an automatically versioned component changes.
+    """
+    def __init__(self, inclusions, bower=None):
+        self.inclusions = inclusions
+        self.bower = bower
+        autoversioned = []
+        for inclusion in inclusions:
+            for component in inclusion.components():
+                if component.autoversion and component not in autoversioned:
+                    autoversioned.append(component)
+        self._autoversioned = autoversioned
+        self._rendered = None
+        self._link_header = None
+        self._bundled = None
+
+    def versions(self):
+        return tuple(component.version for component in self._autoversioned)
+
+    def reset(self):
+        """Forget the rendered HTML."""
+        self._rendered = None
+        self._link_header = None
+
+    def parts(self):
+        """The inclusions and bundles to render, in order."""
+        if self.bower is not None and self.bower.bundler is not None:
+            # keep the bundles we render around, so that the bundler
+            # can serve them for as long as we are remembered
+            self._bundled = self.bundled()
+            return self._bundled
+        return self.inclusions
+
+    def html(self):
+        versions = self.versions()
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == versions:
+            return rendered[1]
+        html = '\n'.join([part.html() for part in self.parts()])
+        self._rendered = versions, html
+        return html
+
+    def link_header(self):
+        """A ``Link`` header value to preload the resources.
+
+        Returns ``None`` if there is nothing to preload.
+        """
+        versions = self.versions()
+        link_header = self._link_header
+        if link_header is not None and link_header[0] == versions:
+            return link_header[1]
+        links = ['<%s>; rel=preload; as=%s' % link
+                 for part in self.parts() for link in part.links()]
+        result = ', '.join(links) or None
+        self._link_header = versions, result
+        return result
+
+    def bundled(self):
+        """Replace runs of resources with the same extension by bundles.
+
+        A bundle takes the place of the first resource in it. A
+        resource with the same extension that cannot be bundled, such as
+        one with a custom renderer, ends the run so that the order of the
+        resources is kept.
+        """
+        bundler = self.bower.bundler
+        items = []
+        runs = {}
+        for inclusion in self.inclusions:
+            if inclusion.bundleable(bundler):
+                ext = inclusion.resource.ext
+                run = runs.get(ext)
+                if run is None:
+                    run = runs[ext] = []
+                    items.append(run)
+                run.append(inclusion)
+                continue
+            resource = getattr(inclusion, 'resource', None)
+            if resource is None:
+                runs.clear()
+            else:
+                runs.pop(resource.ext, None)
+            items.append(inclusion)
+        result = []
+        for item in items:
+            if not isinstance(item, list):
+                result.append(item)
+            elif len(item) == 1:
+                result.append(item[0])
+            else:
+                resources = [inclusion.resource for inclusion in item]
+                name = bundler.bundle(resources[0].ext, resources)
+                result.append(Bundle(self.bower, name, resources))
+        return result
 
 
 class Inclusion(object):
+    __slots__ = ()
+
     def dependencies(self):
         return []
 
+    def members(self):
+        return []
+
+    def components(self):
+        return []
+
+    def links(self):
+        """(url, as) pairs of the resources to preload."""
+        return []
+
+    def bundleable(self, bundler):
+        return False
+
+    def cacheable(self):
+        return True
+
+    def key(self):
+        return self
+
     def html(self):
         raise NotImplementedError()
 
 
 class ResourceInclusion(Inclusion):
+    __slots__ = ('resource', 'renderer_key')
+
     def __init__(self, resource, renderer=None):
         self.resource = resource
-        self.renderer = (make_renderer(renderer) if renderer
-                         else resource.renderer())
+        # the renderer is only looked up when rendering
+        self.renderer_key = renderer
 
     def __repr__(self):
         return ('<bowerstatic.includer.ResourceInclusion for %s>' %
-                self.resource.path)
+                self.resource.url())
 
     def __hash__(self):
         return hash(self.resource)
 
     def __eq__(self, other):
-        return self.resource is other.resource
+        return (isinstance(other, ResourceInclusion) and
+                self.resource is other.resource)
 
     def __ne__(self, other):
-        return self.resource is not other.resource
+        return not self == other
 
     def dependencies(self):
         return [ResourceInclusion(resource)
                 for resource in self.resource.dependencies]
 
+    def components(self):
+        return [self.resource.component]
+
+    def bundleable(self, bundler):
+        # resources with a custom renderer are rendered on their own
+        return (self.renderer_key is None and
+                self.resource.ext in bundler.extensions)
+
+    def cacheable(self):
+        # a callable renderer may render differently for each request
+        return (self.renderer_key is None or
+                isinstance(self.renderer_key, string_types))
+
+    def key(self):
+        return self.resource, self.renderer_key
+
+    def links(self):
+        # a custom renderer that is not a format string may well inline
+        renderer_key = self.renderer_key
+        if renderer_key is not None and (
+                not isinstance(renderer_key, string_types) or
+                inlines(renderer_key)):
+            return []
+        preload_as = self.resource.component.bower.preload_as(self.resource)
+        if preload_as is None:
+            return []
+        return [(self.resource.url(), preload_as)]
+
+    def renderer(self):
+        if self.renderer_key:
+            return make_renderer(self.renderer_key)
+        return self.resource.renderer()
+
+    def html(self):
+        return self.renderer()(self.resource)
+
+
+class IncludeSet(Inclusion):
+    """A named set of resources that is sorted and rendered in advance.
+    """
+    def __init__(self, bower, name, resources, renderer=None):
+        self.bower = bower
+        self.name = name
+        inclusions = Inclusions(bower)
+        for resource in resources:
+            inclusions.add(ResourceInclusion(resource, renderer))
+        self._sorted = inclusions.sorted()
+        self._members = self._sorted.inclusions
+        components = []
+        for inclusion in self._members:
+            for component in inclusion.components():
+                if component not in components:
+                    components.append(component)
+        self._components = components
+        self._sorted.html()
+
+    def __repr__(self):
+        return '<bowerstatic.includer.IncludeSet %s>' % self.name
+
+    def members(self):
+        return self._members
+
+    def components(self):
+        return self._components
+
+    def links(self):
+        return [link for part in self._sorted.parts()
+                for link in part.links()]
+
+    def reset(self):
+        self._sorted.reset()
+
     def html(self):
-        return self.renderer(self.resource)
+        return self._sorted.html()
@@ -0,0 +1,51 @@
+"""A persistent index of the components in a bower_components directory.
+
+The index remembers the metadata read from each component's
+``.bower.json`` together with the modification time of the component's
+directory, so that only components whose directory changed need to be
+read again.
+"""
+import json
+import os
+from .utility import write_atomic
+
+INDEX_FORMAT = 1
+
+
+def read_index(index_path, path):
+    """Read the index for the bower_components directory path.
+
+    Returns the index as a dictionary, or ``None`` if there is no usable
+    index.
+    """
+    try:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(index, dict):
+        return None
+    if index.get('format') != INDEX_FORMAT or index.get('path') != path:
+        return None
+    return index
+
+
+def write_index(index_path, path, mtime, entries):
+    index = {
+        'format': INDEX_FORMAT,
+        'path': path,
+        'mtime': mtime,
+        'components': entries,
+    }
+    write_atomic(index_path, json.dumps(index).encode('utf-8'))
+
+
+def list_component_directories(path):
+    result = []
+    for component_path in os.listdir(path):
+        if component_path.startswith('.'):
+            continue
+        if not os.path.isdir(os.path.join(path, component_path)):
+            continue
+        result.append(component_path)
+    return result
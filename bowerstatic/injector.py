@@ -4,11 +4,15 @@ CONTENT_TYPES = set(['text/html', 'application/xhtml+xml'])
 
 METHODS = set(['GET', 'POST', 'HEAD'])
 
+HEAD_END = b'</head>'
+
 
 class InjectorTween(object):
-    def __init__(self, bower, handler):
+    def __init__(self, bower, handler, streaming=False, preload=False):
         self.bower = bower
         self.handler = handler
+        self.streaming = streaming
+        self.preload = preload
 
     def __call__(self, request):
         response = self.handler(request)
@@ -21,19 +25,79 @@ class InjectorTween(object):
         inclusions = request.environ.get('bowerstatic.inclusions')
         if inclusions is None:
             return response
+        sorted_inclusions = inclusions.get_sorted()
+        if self.preload:
+            link_header = sorted_inclusions.link_header()
+            if link_header:
+                response.headers.add('Link', link_header)
+        if self.streaming:
+            inject_app_iter(response,
+                            sorted_inclusions.html().encode('utf-8'))
+            return response
         body = response.body
         response.body = b''
-        rendered_inclusions = (inclusions.render() + '</head>').encode('utf-8')
+        rendered_inclusions = (
+            sorted_inclusions.html() + '</head>').encode('utf-8')
         body = body.replace(b'</head>', rendered_inclusions)
         response.write(body)
         return response
 
 
+def inject_app_iter(response, snippet):
+    """Inject snippet before the first ``</head>`` in the response.
+
+    Only the chunks up to and including ``</head>`` are consumed from
+    the response's app_iter; the remaining chunks are passed through
+    untouched when the response is sent.
+    """
+    app_iter = response.app_iter
+    content_length = response.content_length
+    chunks = iter(app_iter)
+    buffered = []
+    tail = b''
+    found = False
+    for chunk in chunks:
+        buffered.append(chunk)
+        # the end tag may be split over chunk boundaries
+        window = tail + chunk
+        if HEAD_END in window:
+            found = True
+            break
+        tail = window[-(len(HEAD_END) - 1):]
+    if found:
+        data = b''.join(buffered)
+        index = data.find(HEAD_END)
+        buffered = [data[:index], snippet, data[index:]]
+        if content_length is not None:
+            content_length += len(snippet)
+    # setting app_iter resets the content length
+    response.app_iter = InjectedAppIter(buffered, chunks, app_iter)
+    response.content_length = content_length
+
+
+class InjectedAppIter(object):
+    def __init__(self, head, rest, app_iter):
+        self.head = head
+        self.rest = rest
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        for chunk in self.head:
+            yield chunk
+        for chunk in self.rest:
+            yield chunk
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
 class Injector(object):
-    def __init__(self, bower, wsgi):
+    def __init__(self, bower, wsgi, streaming=False, preload=False):
         def handler(request):
             return request.get_response(wsgi)
-        self.tween = InjectorTween(bower, handler)
+        self.tween = InjectorTween(bower, handler, streaming, preload)
 
     @webob.dec.wsgify
     def __call__(self, request):
@@ -1,6 +1,15 @@
+import calendar
+import hashlib
+import mimetypes
+import mmap
+import os
 import webob
-from webob.static import FileApp
+from webob.static import FileIter, BLOCK_SIZE
 import time
+import uuid
+from webob.datetime_utils import parse_date
+from .bundle import BUNDLE_NAME
+from .cache import FileInfo
 
 
 MINUTE_IN_SECONDS = 60
@@ -11,6 +20,18 @@ YEAR_IN_SECONDS = DAY_IN_SECONDS * 365
 # arbitrarily define forever as 10 years in the future
 FOREVER = YEAR_IN_SECONDS * 10
 
+CACHED_METHODS = set(['GET', 'HEAD'])
+
+# files at least this big are memory mapped if the server has no
+# wsgi.file_wrapper
+MMAP_MIN_SIZE = 256 * 1024
+
+# requests for more ranges than this get the whole file
+MAX_RANGES = 16
+
+# the URLs of published files contain a version, so they never change
+CACHE_CONTROL = 'max-age=%s, immutable' % FOREVER
+
 
 class PublisherTween(object):
     def __init__(self, bower, handler):
@@ -23,21 +44,17 @@ class PublisherTween(object):
         # pass through to underlying WSGI app
         if publisher_signature != self.bower.publisher_signature:
             return self.handler(request)
-        request.path_info_pop()
-        # next segment is BowerComponents name
-        bower_components_name = request.path_info_pop()
-        if bower_components_name is None:
+        # the remaining segments are the components name, the component
+        # name, its version and the path of the file in the component
+        parts = request.path_info.lstrip('/').split('/', 4)
+        if len(parts) < 2 or parts[1] == '':
             return webob.exc.HTTPNotFound()
-        # next segment is component name
-        component_name = request.path_info_pop()
-        if component_name is None:
+        if parts[1] == BUNDLE_NAME and self.bower.bundler is not None:
+            return self.serve_bundle(request, '/'.join(parts[2:]))
+        if len(parts) < 5:
             return webob.exc.HTTPNotFound()
-        # next segment is component version
-        component_version = request.path_info_pop()
-        if component_version is None:
-            return webob.exc.HTTPNotFound()
-        # the rest of the path goes into component
-        file_path = request.path_info.lstrip('/')
+        (dummy, bower_components_name, component_name, component_version,
+         file_path) = parts
         if file_path.strip() == '':
             return webob.exc.HTTPNotFound()
         filename = self.bower.get_filename(bower_components_name,
@@ -46,14 +63,364 @@ class PublisherTween(object):
                                            file_path)
         if filename is None:
             return webob.exc.HTTPNotFound()
-        file_app = FileApp(filename)
-        response = request.get_response(file_app)
-        if response.status_code == 200:
-            response.cache_control.max_age = FOREVER
-            response.expires = time.time() + FOREVER
-        # XXX do we really want to rely on mimetype guessing?
+        key = (bower_components_name, component_name, component_version,
+               file_path)
+        return self.serve(request, key, filename)
+
+    def serve_bundle(self, request, name):
+        if request.method not in CACHED_METHODS:
+            return method_not_allowed(request)
+        cached = self.bower.bundler.get(name)
+        if cached is None:
+            return webob.exc.HTTPNotFound()
+        return cached_response(request, cached)
+
+    def serve(self, request, key, filename):
+        if request.method not in CACHED_METHODS:
+            return method_not_allowed(request)
+        compressor = self.bower.compressor
+        if compressor is None or not compressor.compressible(filename):
+            return self.serve_file(request, key, filename)
+        encoding = compressor.choose(
+            request.headers.get('Accept-Encoding', ''), filename)
+        if encoding is None:
+            response = self.serve_file(request, key, filename)
+        else:
+            response = self.serve_variant(request, key, filename, encoding)
+        response.vary = ('Accept-Encoding',)
         return response
 
+    def serve_variant(self, request, key, filename, encoding):
+        # answer conditional requests without looking at the file
+        variant_key = key + (encoding,)
+        file_info = self.bower._file_info
+        info = file_info.get(variant_key)
+        if info is not None and not_modified(request, info):
+            return not_modified_response(info)
+        variant = self.bower.compressor.variant(filename, encoding)
+        if variant is None:
+            # the file is served as it is, for instance as it is small
+            response = self.serve_file(request, key, filename)
+            info = file_info.get(key)
+            if info is not None:
+                file_info.set(variant_key, info)
+            return response
+        encoding, path, cached = variant
+        content_type, dummy = mimetypes.guess_type(filename)
+        if cached is not None:
+            file_info.set(variant_key, FileInfo(cached.etag, cached.mtime))
+            return cached_response(request, cached,
+                                   content_type=content_type)
+        return self.serve_file(request, variant_key, path,
+                               content_type=content_type,
+                               content_encoding=encoding)
+
+    def serve_file(self, request, key, filename, **kw):
+        file_info = self.bower._file_info
+        info = file_info.get(key)
+        if info is not None and not_modified(request, info):
+            return not_modified_response(info)
+        file_cache = self.bower.file_cache
+        if file_cache is not None:
+            cached = file_cache.get(key, filename)
+            if cached is not None:
+                file_info.set(key, FileInfo(cached.etag, cached.mtime))
+                return cached_response(request, cached, **kw)
+        try:
+            stat = os.stat(filename)
+        except (IOError, OSError):
+            return webob.exc.HTTPNotFound()
+        info = FileInfo(file_etag(key, stat), stat.st_mtime)
+        file_info.set(key, info)
+        if not_modified(request, info):
+            return not_modified_response(info)
+        return file_response(request, filename, stat, info, **kw)
+
+
+def method_not_allowed(request):
+    return webob.exc.HTTPMethodNotAllowed(
+        "You cannot %s a file" % request.method)
+
+
+def file_etag(key, stat):
+    """A strong ETag for the file published under key.
+    """
+    data = '\0'.join(key + (str(stat.st_size), repr(stat.st_mtime)))
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def not_modified(request, info):
+    if request.if_none_match:
+        return info.etag in request.if_none_match
+    if_modified_since = request.if_modified_since
+    if if_modified_since is None:
+        return False
+    return calendar.timegm(if_modified_since.utctimetuple()) >= int(
+        info.mtime)
+
+
+def not_modified_response(info):
+    response = webob.Response(status=304)
+    response.etag = info.etag
+    response.last_modified = info.mtime
+    set_forever(response)
+    return response
+
+
+def file_response(request, filename, stat, info, content_type=None,
+                  content_encoding=None):
+    guessed_type, guessed_encoding = mimetypes.guess_type(filename)
+    content_type = content_type or guessed_type
+    content_encoding = content_encoding or guessed_encoding
+    ranges = requested_ranges(request, info, stat.st_size,
+                              multiple=content_encoding is None)
+    if ranges == []:
+        return range_not_satisfiable(stat.st_size)
+    try:
+        f = open(filename, 'rb')
+    except (IOError, OSError):
+        return webob.exc.HTTPForbidden()
+    app_iter = None
+    if ranges is None and 'wsgi.file_wrapper' in request.environ:
+        app_iter = request.environ['wsgi.file_wrapper'](f, BLOCK_SIZE)
+    elif stat.st_size >= MMAP_MIN_SIZE:
+        try:
+            app_iter = MmapIter(f)
+        except (ValueError, EnvironmentError):
+            pass
+    if ranges is not None:
+        return range_response(ranges, stat.st_size, info, content_type,
+                              content_encoding, app_iter or FileRanges(f))
+    if app_iter is None:
+        app_iter = FileIter(f)
+    response = webob.Response(
+        app_iter=app_iter,
+        content_type=content_type,
+        content_encoding=content_encoding,
+        content_length=stat.st_size,
+        accept_ranges='bytes',
+        last_modified=info.mtime,
+        etag=info.etag)
+    set_forever(response)
+    return response
+
+
+def requested_ranges(request, info, size, multiple=True):
+    """The byte ranges requested with a ``Range`` header.
+
+    Returns a list of ``(start, stop)`` tuples, an empty list if none of
+    the ranges can be satisfied, or ``None`` if the whole file should be
+    sent.
+    """
+    if request.method != 'GET':
+        return None
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range is not None and not if_range_matches(if_range, info):
+        return None
+    unit, sep, specs = header.partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES or (len(specs) > 1 and not multiple):
+        return None
+    result = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                stop = int(last) + 1 if last else size
+                if last and stop <= start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                start, stop = max(size - suffix, 0), size
+        except ValueError:
+            return None
+        if start >= size or start == stop:
+            continue
+        result.append((start, min(stop, size)))
+    return result
+
+
+def if_range_matches(if_range, info):
+    if if_range.startswith('"'):
+        return if_range == '"%s"' % info.etag
+    if if_range.startswith('W/'):
+        # weak entity tags are never good enough for ranges
+        return False
+    date = parse_date(if_range)
+    if date is None:
+        return False
+    return calendar.timegm(date.utctimetuple()) == int(info.mtime)
+
+
+def range_not_satisfiable(size):
+    response = webob.exc.HTTPRequestRangeNotSatisfiable()
+    response.headers['Content-Range'] = 'bytes */%s' % size
+    return response
+
+
+def range_response(ranges, size, info, content_type, content_encoding,
+                   source):
+    """A ``206 Partial Content`` response for ranges of source.
+
+    Several ranges are sent as a ``multipart/byteranges`` body.
+    """
+    if len(ranges) == 1:
+        (start, stop), = ranges
+        response = webob.Response(
+            status=206,
+            app_iter=RangeIter(source, [(b'', start, stop)]),
+            content_type=content_type,
+            content_encoding=content_encoding,
+            content_length=stop - start)
+        response.headers['Content-Range'] = 'bytes %s-%s/%s' % (
+            start, stop - 1, size)
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for start, stop in ranges:
+            header = ('\r\n--%s\r\nContent-Type: %s\r\n'
+                      'Content-Range: bytes %s-%s/%s\r\n\r\n' % (
+                          boundary, content_type, start, stop - 1, size))
+            parts.append((header.encode('ascii'), start, stop))
+        end = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+        response = webob.Response(
+            status=206,
+            app_iter=RangeIter(source, parts, end),
+            content_type=None,
+            content_length=sum(len(header) + stop - start
+                               for header, start, stop in parts) + len(end))
+        response.headers['Content-Type'] = (
+            'multipart/byteranges; boundary=%s' % boundary)
+    response.accept_ranges = 'bytes'
+    response.last_modified = info.mtime
+    response.etag = info.etag
+    set_forever(response)
+    return response
+
+
+def set_forever(response):
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.expires = time.time() + FOREVER
+
+
+def cached_response(request, cached, content_type=None,
+                    content_encoding=None):
+    content_type = content_type or cached.content_type
+    content_encoding = content_encoding or cached.content_encoding
+    info = FileInfo(cached.etag, cached.mtime)
+    if not_modified(request, info):
+        return not_modified_response(info)
+    ranges = requested_ranges(request, info, cached.size,
+                              multiple=content_encoding is None)
+    if ranges == []:
+        return range_not_satisfiable(cached.size)
+    if ranges is not None:
+        return range_response(ranges, cached.size, info, content_type,
+                              content_encoding, BodyRanges(cached.body))
+    response = webob.Response(
+        body=cached.body,
+        content_type=content_type,
+        content_encoding=content_encoding,
+        accept_ranges='bytes',
+        last_modified=cached.mtime,
+        etag=cached.etag)
+    set_forever(response)
+    return response
+
+
+class MmapIter(object):
+    """Iterates over a memory mapped file in blocks.
+
+    The blocks are sliced from the operating system's page cache, so
+    the file is never read into a buffer of its own.
+    """
+    def __init__(self, f, block_size=BLOCK_SIZE):
+        self.file = f
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.block_size = block_size
+        self.start = 0
+        self.stop = len(self.map)
+
+    def app_iter_range(self, start, stop):
+        size = len(self.map)
+        self.start = min(start or 0, size)
+        self.stop = size if stop is None else min(stop, size)
+        return self
+
+    def __iter__(self):
+        m = self.map
+        stop = self.stop
+        block_size = self.block_size
+        for position in range(self.start, stop, block_size):
+            yield m[position:min(position + block_size, stop)]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class FileRanges(object):
+    """Reads ranges of an open file."""
+    def __init__(self, f, block_size=BLOCK_SIZE):
+        self.file = f
+        self.block_size = block_size
+
+    def app_iter_range(self, start, stop):
+        self.file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = self.file.read(min(self.block_size, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+class BodyRanges(object):
+    """Ranges of a body in memory."""
+    def __init__(self, body):
+        self.body = body
+
+    def app_iter_range(self, start, stop):
+        return [self.body[start:stop]]
+
+    def close(self):
+        pass
+
+
+class RangeIter(object):
+    """Iterates over ranges of source, each preceded by a header.
+    """
+    def __init__(self, source, parts, end=b''):
+        self.source = source
+        self.parts = parts
+        self.end = end
+
+    def __iter__(self):
+        for header, start, stop in self.parts:
+            if header:
+                yield header
+            for chunk in self.source.app_iter_range(start, stop):
+                yield chunk
+        if self.end:
+            yield self.end
+
+    def close(self):
+        self.source.close()
+
 
 class Publisher(object):
     def __init__(self, bower, wsgi):
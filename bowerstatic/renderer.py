@@ -6,6 +6,10 @@ from .compat import string_types
 class Renderer(object):
     def __init__(self):
         self._renderers = {}
+        # extension to the "as" value of a preload link
+        self._preload_as = {'.js': 'script', '.css': 'style'}
+        # extensions of which the resources are not preloaded
+        self._no_preload = set()
         self.register('.js', render_js)
         self.register('.css', render_css)
         self.register('.ico', render_favicon)
@@ -13,8 +17,16 @@ class Renderer(object):
         self.register('.png', render_favicon)
         self.register('.jpg', render_favicon)
 
-    def register(self, ext, renderer):
+    def register(self, ext, renderer, preload_as=None):
         self._renderers[ext] = make_renderer(renderer)
+        # an inlined resource is not loaded through its URL
+        if preload_as is False or (preload_as is None and
+                                   inlines(renderer)):
+            self._no_preload.add(ext)
+            return
+        self._no_preload.discard(ext)
+        if preload_as is not None:
+            self._preload_as[ext] = preload_as
 
     def filter_by_known_ext(self, paths):
         result = []
@@ -31,6 +43,18 @@ class Renderer(object):
         except KeyError:
             raise Error("Unknown extension for url: %s" % resource.url())
 
+    def preload_as(self, resource):
+        if resource.ext in self._no_preload:
+            return None
+        return self._preload_as.get(resource.ext)
+
+
+def inlines(renderer):
+    """True if renderer is a format string that inlines the content.
+    """
+    return (isinstance(renderer, string_types) and
+            '{content}' in renderer)
+
 
 def make_renderer(renderer):
     if isinstance(renderer, string_types):
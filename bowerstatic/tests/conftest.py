@@ -0,0 +1,7 @@
+import sys
+
+collect_ignore = []
+
+if sys.version_info < (3, 5):
+    # the ASGI support uses async syntax
+    collect_ignore.append('test_asgi.py')
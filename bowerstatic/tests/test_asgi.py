@@ -0,0 +1,164 @@
+import asyncio
+import bowerstatic
+import os
+from bowerstatic.asgi import Publisher, Injector, wrap
+
+
+def run(app, path, method='GET', headers=()):
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app(scope, receive, send))
+    finally:
+        loop.close()
+    start = messages[0]
+    assert start['type'] == 'http.response.start'
+    headers = dict((name.decode('latin-1'), value.decode('latin-1'))
+                   for name, value in start['headers'])
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    assert not messages[-1].get('more_body', False)
+    return start['status'], headers, body
+
+
+def make_bower():
+    bower = bowerstatic.Bower()
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    return bower, components
+
+
+def html_app(components, chunks, includes=('jquery',), content_length=True):
+    async def app(scope, receive, send):
+        include = components.includer(scope)
+        for path in includes:
+            include(path)
+        headers = [(b'content-type', b'text/html; charset=utf-8')]
+        if content_length:
+            headers.append(
+                (b'content-length', str(sum(map(len, chunks))).encode()))
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': headers})
+        for i, chunk in enumerate(chunks):
+            await send({'type': 'http.response.body', 'body': chunk,
+                        'more_body': i < len(chunks) - 1})
+    return app
+
+
+async def hello(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b'Hello!'})
+
+
+def test_asgi_publisher():
+    bower, components = make_bower()
+    app = Publisher(bower, hello)
+
+    status, headers, body = run(
+        app, '/bowerstatic/components/jquery/2.1.1/dist/jquery.js')
+    assert status == 200
+    assert body == b'/* jquery.js 2.1.1 */\n'
+    assert headers['content-length'] == str(len(body))
+    assert 'immutable' in headers['cache-control']
+
+    status, headers, body = run(
+        app, '/bowerstatic/components/jquery/2.1.1/dist/jquery.js',
+        headers=[('If-None-Match', headers['etag'])])
+    assert status == 304
+    assert body == b''
+
+    status, headers, body = run(
+        app, '/bowerstatic/components/jquery/2.1.1/dist/jquery.js',
+        headers=[('Range', 'bytes=3-8')])
+    assert status == 206
+    assert body == b'jquery'
+
+    status, headers, body = run(
+        app, '/bowerstatic/components/jquery/2.1.1/dist/jquery.js',
+        method='HEAD')
+    assert status == 200
+    assert body == b''
+
+
+def test_asgi_publisher_not_found():
+    bower, components = make_bower()
+    app = Publisher(bower, hello)
+
+    status, headers, body = run(
+        app, '/bowerstatic/components/jquery/2.1.1/nonexistent.js')
+    assert status == 404
+
+
+def test_asgi_publisher_passthrough():
+    bower, components = make_bower()
+    app = Publisher(bower, hello)
+
+    assert run(app, '/') == (200, {'content-type': 'text/plain'}, b'Hello!')
+    assert run(app, '/bowerstaticfoo')[2] == b'Hello!'
+
+
+def test_asgi_injector():
+    bower, components = make_bower()
+    html = b'<html><head></head><body>Hello!</body></html>'
+    # split the end tag over two messages
+    app = Injector(bower, html_app(components, [html[:10], html[10:]]))
+
+    status, headers, body = run(app, '/')
+    snippet = (b'<script type="text/javascript" '
+               b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+               b'</script>')
+    assert body == (b'<html><head>' + snippet +
+                    b'</head><body>Hello!</body></html>')
+    assert headers['content-length'] == str(len(body))
+    assert 'link' not in headers
+
+
+def test_asgi_injector_no_head():
+    bower, components = make_bower()
+    app = Injector(bower, html_app(components, [b'<p>', b'Hello!</p>'],
+                                   content_length=False))
+
+    status, headers, body = run(app, '/')
+    assert body == b'<p>Hello!</p>'
+
+
+def test_asgi_injector_nothing_included():
+    bower, components = make_bower()
+    html = b'<html><head></head><body>Hello!</body></html>'
+    app = Injector(bower, html_app(components, [html], includes=()))
+
+    status, headers, body = run(app, '/')
+    assert body == html
+
+
+def test_asgi_injector_not_html():
+    bower, components = make_bower()
+    app = Injector(bower, hello)
+
+    assert run(app, '/')[2] == b'Hello!'
+
+
+def test_asgi_injector_preload():
+    bower, components = make_bower()
+    html = b'<html><head></head><body>Hello!</body></html>'
+    app = wrap(bower, html_app(components, [html]), preload=True)
+
+    status, headers, body = run(app, '/')
+    assert headers['link'] == (
+        '</bowerstatic/components/jquery/2.1.1/dist/jquery.js>; '
+        'rel=preload; as=script')
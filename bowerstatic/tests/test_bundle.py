@@ -0,0 +1,273 @@
+from webtest import TestApp as Client
+import bowerstatic
+from bowerstatic.bundle import rewrite_css_urls
+import json
+import mimetypes
+import pytest
+import os
+import re
+import stat
+
+
+def make_component(tmpdir):
+    bower_components_dir = tmpdir.mkdir('bower_components')
+    component_dir = bower_components_dir.mkdir('component')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': ['a.js', 'a.css']
+    }))
+    component_dir.join('a.js').write('var a = 1')
+    component_dir.join('b.js').write('var b = 2;')
+    component_dir.join('a.css').write('.a { background: url(img/a.png); }')
+    component_dir.mkdir('css').join('b.css').write(
+        ".b { background: url('../img/b.png'); }")
+    return bower_components_dir
+
+
+def make_client(tmpdir, includes, bundler=None, preload=False):
+    bower_components_dir = make_component(tmpdir)
+    bower = bowerstatic.Bower(bundler=bundler or bowerstatic.Bundler())
+
+    components = bower.components('components', bower_components_dir.strpath)
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        for path, renderer in includes:
+            include(path, renderer)
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    return bower, Client(bower.publisher(
+        bower.injector(wsgi, preload=preload)))
+
+
+def bundle_urls(body):
+    return re.findall(r'(?:src|href)="(/bowerstatic/_bundle/[^"]+)"',
+                      body.decode('utf-8'))
+
+
+def test_bundle(tmpdir):
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', None),
+        ('component/a.css', None),
+        ('component/css/b.css', None),
+    ])
+
+    response = c.get('/')
+    js_url, css_url = bundle_urls(response.body)
+    assert js_url.endswith('.js')
+    assert css_url.endswith('.css')
+    assert response.body == (
+        b'<html><head>'
+        b'<script type="text/javascript" src="' + js_url.encode('utf-8') +
+        b'"></script>\n'
+        b'<link rel="stylesheet" type="text/css" href="' +
+        css_url.encode('utf-8') + b'">'
+        b'</head><body>Hello!</body></html>')
+
+    response = c.get(js_url)
+    assert response.body == b'var a = 1\n;\nvar b = 2;'
+    assert response.content_type == mimetypes.guess_type(js_url)[0]
+
+    response = c.get(css_url)
+    assert response.body == (
+        b'.a { background: '
+        b'url(/bowerstatic/components/component/2.1/img/a.png); }\n'
+        b".b { background: "
+        b"url('/bowerstatic/components/component/2.1/img/b.png'); }")
+
+    # the same inclusions result in the same bundle
+    assert bundle_urls(c.get('/').body) == [js_url, css_url]
+
+
+def test_bundle_single_resource_not_bundled(tmpdir):
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/a.css', None),
+    ])
+
+    response = c.get('/')
+    assert response.body == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/component/2.1/a.js"></script>\n'
+        b'<link rel="stylesheet" type="text/css" '
+        b'href="/bowerstatic/components/component/2.1/a.css">'
+        b'</head><body>Hello!</body></html>')
+
+
+def test_bundle_custom_renderer_ends_run(tmpdir):
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', bowerstatic.render_inline_js),
+        ('component/a.css', None),
+        ('component/css/b.css', None),
+    ])
+
+    response = c.get('/')
+    css_url, = bundle_urls(response.body)
+    assert response.body == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/component/2.1/a.js"></script>\n'
+        b'<script type="text/javascript">var b = 2;</script>\n'
+        b'<link rel="stylesheet" type="text/css" href="' +
+        css_url.encode('utf-8') + b'">'
+        b'</head><body>Hello!</body></html>')
+
+
+def test_bundle_changes_with_version(tmpdir):
+    component_dir = tmpdir.mkdir('component')
+    component_dir.join('bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '1.0',
+        'main': 'a.js'
+    }))
+    a_js = component_dir.join('a.js')
+    a_js.write('var a = 1;')
+    component_dir.join('b.js').write('var b = 2;')
+
+    bower = bowerstatic.Bower(bundler=bowerstatic.Bundler())
+    components = bower.components('components', make_component(
+        tmpdir.mkdir('other')).strpath)
+    local = bower.local_components('local', components)
+    local.component(component_dir.strpath, version=None)
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = local.includer(environ)
+        include('component/a.js')
+        include('component/b.js')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    c = Client(bower.wrap(wsgi))
+
+    url, = bundle_urls(c.get('/').body)
+    assert c.get(url).body == b'var a = 1;\n;\nvar b = 2;'
+
+    a_js.write('var a = 3;')
+    a_js.setmtime(a_js.mtime() + 10)
+
+    new_url, = bundle_urls(c.get('/').body)
+    assert new_url != url
+    assert c.get(new_url).body == b'var a = 3;\n;\nvar b = 2;'
+
+
+def test_bundle_forgets_old_bundles(tmpdir):
+    bundler = bowerstatic.Bundler(max_bundles=1)
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', None),
+        ('component/a.css', None),
+        ('component/css/b.css', None),
+    ], bundler=bundler)
+
+    js_url, css_url = bundle_urls(c.get('/').body)
+    assert len(bundler._names) == 1
+    assert len(bundler._parts) == 1
+    # the most recent bundle can still be made again
+    bundler._cache.clear()
+    c.get(css_url)
+
+    bundler.clear()
+    assert len(bundler._names) == 0
+    assert len(bundler._parts) == 0
+
+
+def test_bundle_rendered_bundle_stays_available(tmpdir):
+    # nothing fits in memory, and only one bundle is remembered
+    bundler = bowerstatic.Bundler(max_bundles=1, max_size=1)
+    bower = bowerstatic.Bower(bundler=bundler)
+    components = bower.components('components',
+                                  make_component(tmpdir).strpath)
+    components.include_set('s', ['component/a.js', 'component/b.js'])
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        if environ['PATH_INFO'] == '/s':
+            include.set('s')
+        else:
+            include('component/a.css')
+            include('component/css/b.css')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    c = Client(bower.wrap(wsgi))
+
+    c.get('/other')
+    url, = bundle_urls(c.get('/s').body)
+    assert c.get(url).body == b'var a = 1\n;\nvar b = 2;'
+
+
+def test_bundle_cache_dir(tmpdir):
+    cache_dir = tmpdir.mkdir('bundles')
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', None),
+    ], bundler=bowerstatic.Bundler(cache_dir=cache_dir.strpath))
+
+    url, = bundle_urls(c.get('/').body)
+    bundle_file = cache_dir.join(url.split('/')[-1])
+    assert bundle_file.read() == 'var a = 1\n;\nvar b = 2;'
+    # processes of other users can read it
+    assert stat.S_IMODE(os.stat(bundle_file.strpath).st_mode) == 0o644
+
+    # another process sharing the cache directory can serve it
+    other = bowerstatic.Bower(
+        bundler=bowerstatic.Bundler(cache_dir=cache_dir.strpath))
+    c = Client(other.publisher(None))
+    assert c.get(url).body == b'var a = 1\n;\nvar b = 2;'
+
+
+def test_bundle_method_not_allowed(tmpdir):
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', None),
+    ])
+
+    url, = bundle_urls(c.get('/').body)
+    c.post(url, status=405)
+
+
+def test_bundle_not_found(tmpdir):
+    bower, c = make_client(tmpdir, [])
+
+    c.get('/bowerstatic/_bundle/nonexistent.js', status=404)
+    c.get('/bowerstatic/_bundle/../../etc/passwd', status=404)
+
+
+def test_bundle_reserved_name():
+    bower = bowerstatic.Bower()
+
+    with pytest.raises(bowerstatic.Error):
+        bower.components('_bundle', '/tmp')
+
+
+def test_rewrite_css_urls():
+    url = '/bowerstatic/components/c/1.0/css/style.css'
+    assert rewrite_css_urls(
+        b'a { b: url(x.png); c: url("../y.png"); d: url( z.png ) }', url) == (
+        b'a { b: url(/bowerstatic/components/c/1.0/css/x.png); '
+        b'c: url("/bowerstatic/components/c/1.0/y.png"); '
+        b'd: url(/bowerstatic/components/c/1.0/css/z.png) }')
+    unchanged = (b'a { b: url(data:image/png;base64,AAA); '
+                 b'c: url(/abs.png); d: url(http://example.com/x.png); '
+                 b'e: url(//example.com/x.png); f: url(#filter) }')
+    assert rewrite_css_urls(unchanged, url) == unchanged
+
+
+def test_bundle_preload(tmpdir):
+    bower, c = make_client(tmpdir, [
+        ('component/a.js', None),
+        ('component/b.js', None),
+        ('component/a.css', None),
+    ], preload=True)
+
+    response = c.get('/')
+    js_url, = bundle_urls(response.body)
+    assert response.headers['Link'] == (
+        '<%s>; rel=preload; as=script, '
+        '</bowerstatic/components/component/2.1/a.css>; rel=preload; '
+        'as=style' % js_url)
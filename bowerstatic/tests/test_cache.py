@@ -0,0 +1,70 @@
+from bowerstatic.cache import LRUCache, ContentCache, strip_whitespace
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    assert cache.keys() == ['a', 'c']
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_max_size():
+    cache = LRUCache(max_size=10)
+    cache.set('a', 'a', 4)
+    cache.set('b', 'b', 4)
+    assert cache.size == 8
+    cache.set('c', 'c', 4)
+    assert 'a' not in cache
+    assert cache.size == 8
+    cache.set('b', 'b', 1)
+    assert cache.size == 5
+    cache.get('b')
+    cache.get('a')
+    assert cache.stats() == {
+        'entries': 2,
+        'size': 5,
+        'hits': 1,
+        'misses': 1,
+        'evictions': 1,
+    }
+
+
+def test_content_cache():
+    content_cache = ContentCache(max_size=10)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return 'abcde'
+
+    assert content_cache.get(('path', 'a.js', '1.0'), '.js', load) == 'abcde'
+    assert content_cache.get(('path', 'a.js', '1.0'), '.js', load) == 'abcde'
+    assert len(loads) == 1
+    assert content_cache.get(('path', 'a.js', '1.1'), '.js', load) == 'abcde'
+    assert len(loads) == 2
+    # too big to keep both versions and another file
+    content_cache.get(('path', 'b.js', '1.0'), '.js', load)
+    assert content_cache.stats()['entries'] == 2
+    content_cache.clear()
+    assert content_cache.stats()['entries'] == 0
+
+
+def test_content_cache_filters():
+    content_cache = ContentCache(filters={'.css': strip_whitespace})
+
+    def load():
+        return '  .a {\n\n    color: red;\n  }\n'
+
+    assert content_cache.get(('path', 'a.css', '1.0'), '.css', load) == (
+        '.a {\ncolor: red;\n}')
+    assert content_cache.get(('path', 'a.js', '1.0'), '.js', load) == (
+        load())
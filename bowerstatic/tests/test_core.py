@@ -1,5 +1,8 @@
 from webtest import TestApp as Client
 import bowerstatic
+from bowerstatic.core import ComponentCollection
+import json
+import mock
 import os
 import pytest
 
@@ -101,3 +104,298 @@ def test_nice_error_message_when_depending_on_not_existing_dependency():
             os.path.dirname(__file__), 'bower_components_error'))
 
     assert "Component i-do-not-exist missing." == str(excinfo.value)
+
+
+read_component_data = ComponentCollection.read_component_data
+
+
+def make_bower_components(tmpdir):
+    bower_components_dir = tmpdir.mkdir('bower_components')
+    for name, dependencies in [('a', {}), ('b', {'a': '*'})]:
+        component_dir = bower_components_dir.mkdir(name)
+        component_dir.join('.bower.json').write(json.dumps({
+            'name': name,
+            'version': '1.0',
+            'main': name + '.js',
+            'dependencies': dependencies,
+        }))
+        component_dir.join(name + '.js').write('/* %s */' % name)
+    return bower_components_dir
+
+
+def test_components_index(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+    index = tmpdir.join('index.json')
+
+    bower = bowerstatic.Bower()
+    bower.components('components', bower_components_dir.strpath,
+                     index=index.strpath)
+
+    assert sorted(json.loads(index.read())['components'].keys()) == [
+        'a', 'b']
+
+    # the index is used instead of reading .bower.json files
+    bower = bowerstatic.Bower()
+    with mock.patch.object(ComponentCollection, 'read_component_data') as m:
+        components = bower.components('components',
+                                      bower_components_dir.strpath,
+                                      index=index.strpath)
+    assert not m.called
+    resources = components.resource('b')
+    assert resources[0].url() == '/bowerstatic/components/b/1.0/b.js'
+    assert resources[0].dependencies[0].url() == (
+        '/bowerstatic/components/a/1.0/a.js')
+
+
+def test_components_index_changed_component(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+    index = tmpdir.join('index.json')
+
+    bower = bowerstatic.Bower()
+    bower.components('components', bower_components_dir.strpath,
+                     index=index.strpath)
+
+    # upgrade component a
+    component_dir = bower_components_dir.join('a')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'a',
+        'version': '2.0',
+        'main': 'a.js',
+    }))
+    component_dir.setmtime(component_dir.mtime() + 10)
+
+    bower = bowerstatic.Bower()
+    with mock.patch.object(ComponentCollection, 'read_component_data',
+                           autospec=True,
+                           side_effect=read_component_data) as m:
+        components = bower.components('components',
+                                      bower_components_dir.strpath,
+                                      index=index.strpath)
+    assert [call[0][1] for call in m.call_args_list] == [
+        component_dir.strpath]
+    assert components.get_component('a').version == '2.0'
+    assert json.loads(index.read())['components']['a']['data'][
+        'version'] == '2.0'
+
+
+def test_components_index_added_component(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+    index = tmpdir.join('index.json')
+
+    bower = bowerstatic.Bower()
+    bower.components('components', bower_components_dir.strpath,
+                     index=index.strpath)
+
+    component_dir = bower_components_dir.mkdir('c')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'c',
+        'version': '1.0',
+    }))
+    bower_components_dir.setmtime(bower_components_dir.mtime() + 10)
+
+    bower = bowerstatic.Bower()
+    components = bower.components('components', bower_components_dir.strpath,
+                                  index=index.strpath)
+    assert components.get_component('c') is not None
+    assert sorted(json.loads(index.read())['components'].keys()) == [
+        'a', 'b', 'c']
+
+
+def test_components_lazy(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+
+    bower = bowerstatic.Bower()
+    with mock.patch.object(ComponentCollection, 'read_component_data') as m:
+        components = bower.components('components',
+                                      bower_components_dir.strpath,
+                                      lazy=True)
+    assert not m.called
+
+    resources = components.resource('b')
+    assert resources[0].url() == '/bowerstatic/components/b/1.0/b.js'
+    assert resources[0].dependencies[0].url() == (
+        '/bowerstatic/components/a/1.0/a.js')
+    assert components.get_component('nonexistent') is None
+
+
+def test_components_lazy_with_index(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+    index = tmpdir.join('index.json')
+
+    bower = bowerstatic.Bower()
+    bower.components('components', bower_components_dir.strpath,
+                     index=index.strpath)
+
+    bower = bowerstatic.Bower()
+    components = bower.components('components', bower_components_dir.strpath,
+                                  index=index.strpath, lazy=True)
+    assert components._components == {}
+    assert components.get_component('a').version == '1.0'
+    assert sorted(components._components.keys()) == ['a']
+
+
+def test_components_lazy_directory_name_differs(tmpdir):
+    bower_components_dir = tmpdir.mkdir('bower_components')
+    component_dir = bower_components_dir.mkdir('directory')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '1.0',
+        'main': 'main.js',
+    }))
+    component_dir.join('main.js').write('/* main */')
+
+    bower = bowerstatic.Bower()
+    components = bower.components('components', bower_components_dir.strpath,
+                                  lazy=True)
+    assert components.get_component('component').path == (
+        component_dir.strpath)
+    assert components.get_component('directory') is None
+
+
+def test_resources_missing_component_remembered():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    with mock.patch.object(ComponentCollection,
+                           'get_component_and_filepaths',
+                           autospec=True, return_value=None) as m:
+        assert components.resources('nonexistent/foo.js') is None
+        assert components.resources('nonexistent/foo.js') is None
+    assert m.call_count == 1
+
+    # adding a component forgets the missing paths
+    components.add(components.get_component('jquery'))
+    with mock.patch.object(ComponentCollection,
+                           'get_component_and_filepaths',
+                           autospec=True, return_value=None) as m:
+        assert components.resources('nonexistent/foo.js') is None
+    assert m.call_count == 1
+
+    bower.invalidate()
+    with mock.patch.object(ComponentCollection,
+                           'get_component_and_filepaths',
+                           autospec=True, return_value=None) as m:
+        assert components.resources('nonexistent/foo.js') is None
+    assert m.call_count == 1
+
+
+def test_resources_have_no_dict():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    resource = components.resources('jquery')[0]
+    assert not hasattr(resource, '__dict__')
+    assert not hasattr(resource.component, '__dict__')
+    inclusion = bowerstatic.includer.ResourceInclusion(resource)
+    assert not hasattr(inclusion, '__dict__')
+
+
+def test_production_mode():
+    bower = bowerstatic.Bower(mode='production')
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    assert components.resources('jquery')[0].url() == (
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.min.js')
+    assert components.resources('jquery/dist/jquery.js')[0].url() == (
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.min.js')
+    assert components.resources('jquery/dist/jquery.min.js')[0].url() == (
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.min.js')
+    # there is no minified variant
+    assert components.resources('jquery-ui')[0].url() == (
+        '/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js')
+    # dependencies are minified too
+    jquery_ui = components.resources('jquery-ui')[0]
+    assert jquery_ui.dependencies[0].file_path == 'dist/jquery.min.js'
+
+
+def test_development_mode():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    assert components.resources('jquery')[0].url() == (
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.js')
+
+
+def test_unknown_mode():
+    with pytest.raises(bowerstatic.Error):
+        bowerstatic.Bower(mode='staging')
+
+
+@pytest.mark.parametrize('mode', ['development', 'production'])
+def test_components_threads(mode):
+    path = os.path.join(os.path.dirname(__file__), 'bower_components')
+
+    def urls(threads):
+        bower = bowerstatic.Bower(mode=mode)
+        components = bower.components('components', path, threads=threads)
+        return sorted(
+            (name, [resource.url() for resource in components.resources(name)
+                    or []])
+            for name in components._components.keys())
+
+    assert urls(4) == urls(None)
+
+
+def test_components_threads_first_error_reported(tmpdir):
+    bower_components_dir = make_bower_components(tmpdir)
+    # the errors differ in position, so we can tell them apart
+    for name in ['c', 'dddd']:
+        bower_components_dir.mkdir(name).join('.bower.json').write(
+            '{"name": "%s", "version": "1.0", "main": "%s.js"' % (name, name))
+
+    bower = bowerstatic.Bower()
+    with pytest.raises(ValueError) as serial:
+        bower.components('serial', bower_components_dir.strpath)
+    with pytest.raises(ValueError) as threaded:
+        bower.components('threaded', bower_components_dir.strpath,
+                         threads=4)
+    assert str(threaded.value) == str(serial.value)
+
+
+def test_resource_closure():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    resource = components.resources('jquery-ui-bootstrap')[0]
+    assert [r.url() for r in resource.closure()] == [
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.js',
+        '/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js',
+        '/bowerstatic/components/jquery-ui-bootstrap/0.2.5/'
+        'jquery.ui.theme.css']
+    # the closure is remembered
+    assert resource.closure() is resource.closure()
+    closure = resource.closure()
+    generation = bower.generation
+    bower.invalidate()
+    assert bower.generation != generation
+    assert resource.closure() is not closure
+    assert resource.closure() == closure
+
+
+def test_merged_inclusions_same_as_sorted():
+    from bowerstatic.includer import Inclusions, ResourceInclusion
+    from bowerstatic.toposort import topological_sort
+
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    inclusions = Inclusions(bower)
+    for path in ['jquery-ui-bootstrap', 'depends_on_multi_main', 'jquery']:
+        for resource in components.resources(path):
+            inclusions.add(ResourceInclusion(resource))
+    expected = topological_sort(inclusions._inclusions,
+                                lambda inclusion: inclusion.dependencies())
+    assert inclusions.merged() == expected
+    assert inclusions.sorted().inclusions == expected
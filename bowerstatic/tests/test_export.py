@@ -0,0 +1,99 @@
+import bowerstatic
+from bowerstatic.export import main
+import gzip
+import json
+import os
+
+
+def make_bower():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    local.component(os.path.join(
+        os.path.dirname(__file__), 'local_component'), version='2.0')
+
+    return bower
+
+
+def test_export(tmpdir):
+    bower = make_bower()
+
+    manifest = bower.export(tmpdir.strpath)
+
+    jquery = tmpdir.join(
+        'bowerstatic', 'components', 'jquery', '2.1.1', 'dist', 'jquery.js')
+    assert jquery.read() == '/* jquery.js 2.1.1 */\n'
+    local = tmpdir.join(
+        'bowerstatic', 'local', 'local_component', '2.0', 'local.js')
+    assert local.read() == '/* this is local.js */\n'
+
+    url = '/bowerstatic/components/jquery/2.1.1/dist/jquery.js'
+    assert manifest[url]['size'] == len(b'/* jquery.js 2.1.1 */\n')
+    with open(tmpdir.join('manifest.json').strpath) as f:
+        assert json.load(f) == manifest
+    assert not tmpdir.join(
+        'bowerstatic', 'components', 'jquery', '2.1.1', 'dist',
+        'jquery.js.gz').exists()
+
+
+def test_export_lazy(tmpdir):
+    path = os.path.join(os.path.dirname(__file__), 'bower_components')
+    bower = bowerstatic.Bower()
+    bower.components('components', path)
+    lazy_bower = bowerstatic.Bower()
+    lazy_bower.components('components', path, lazy=True)
+
+    manifest = bower.export(tmpdir.mkdir('eager').strpath)
+    lazy_manifest = lazy_bower.export(tmpdir.mkdir('lazy').strpath)
+
+    assert manifest
+    assert lazy_manifest == manifest
+
+
+def test_export_urls_match_resource_urls(tmpdir):
+    bower = make_bower()
+
+    manifest = bower.export(tmpdir.strpath, manifest=False)
+
+    components = bower._component_collections['components']
+    resource = components.resource('jquery-ui/ui/jquery-ui.js')[0]
+    assert resource.url() in manifest
+    assert not tmpdir.join('manifest.json').exists()
+
+
+def test_export_compress(tmpdir):
+    bower = make_bower()
+
+    bower.export(tmpdir.strpath, compress=True)
+
+    compressed = tmpdir.join(
+        'bowerstatic', 'components', 'jquery', '2.1.1', 'dist',
+        'jquery.js.gz')
+    with gzip.open(compressed.strpath) as f:
+        assert f.read() == b'/* jquery.js 2.1.1 */\n'
+    assert not tmpdir.join(
+        'bowerstatic', 'components', 'jquery', '2.1.1', 'dist',
+        'resource.foo.gz').exists()
+
+
+def test_export_main(tmpdir, monkeypatch, capsys):
+    monkeypatch.syspath_prepend(tmpdir.strpath)
+    tmpdir.join('export_example.py').write(
+        "import os\n"
+        "import bowerstatic\n"
+        "bower = bowerstatic.Bower()\n"
+        "bower.components('components', %r)\n" % os.path.join(
+            os.path.dirname(__file__), 'bower_components'))
+
+    target = tmpdir.join('target')
+    main(['export_example:bower', target.strpath])
+
+    assert target.join(
+        'bowerstatic', 'components', 'jquery', '2.1.1', 'dist',
+        'jquery.js').read() == '/* jquery.js 2.1.1 */\n'
+    assert target.join('manifest.json').exists()
+    assert 'Exported' in capsys.readouterr()[0]
@@ -4,6 +4,7 @@ import json
 import mock
 import os
 import pytest
+import webob
 
 
 def test_injector_specific_path():
@@ -799,6 +800,41 @@ def test_injector_inline_renderer():
         b'</script></head><body>Hello!</body></html>')
 
 
+def test_injector_inline_renderer_content_cache():
+    content_cache = bowerstatic.ContentCache(
+        filters={'.js': bowerstatic.strip_whitespace})
+    bower = bowerstatic.Bower(inclusions_cache_size=0,
+                              content_cache=content_cache)
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery', bowerstatic.renderer.render_inline_js)
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    with mock.patch.object(bowerstatic.core.Resource, 'read',
+                           autospec=True,
+                           side_effect=bowerstatic.core.Resource.read) as m:
+        for i in range(2):
+            response = c.get('/')
+            assert response.body == (
+                b'<html><head><script type="text/javascript">'
+                b'/* jquery.js 2.1.1 */'
+                b'</script></head><body>Hello!</body></html>')
+        assert m.call_count == 1
+
+        bower.invalidate()
+        c.get('/')
+        assert m.call_count == 2
+
+
 def test_injector_no_content_type_set():
     bower = bowerstatic.Bower()
 
@@ -817,3 +853,551 @@ def test_injector_no_content_type_set():
 
     response = c.get('/')
     assert response.body == (b'SOME-BINARY-OR-NOT-HTML-DATA')
+
+
+def test_injector_reuses_sorted_inclusions():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery-ui')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    Inclusions = bowerstatic.includer.Inclusions
+    with mock.patch.object(Inclusions, 'sorted', autospec=True,
+                           side_effect=Inclusions.sorted) as sort:
+        first = c.get('/').body
+        second = c.get('/').body
+
+    assert sort.call_count == 1
+    assert first == second
+    assert first == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script>\n'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js">'
+        b'</script></head><body>Hello!</body></html>')
+
+
+def test_injector_inclusions_cache_distinguishes_renderers():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    renderers = [None, '<link src="{url}">']
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery', renderers.pop(0))
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    assert c.get('/').body == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script></head><body>Hello!</body></html>')
+    assert c.get('/').body == (
+        b'<html><head>'
+        b'<link src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</head><body>Hello!</body></html>')
+
+
+def test_injector_inclusions_cache_cleared_by_register_renderer():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    c.get('/')
+    bower.register_renderer('.js', '<foo>{url}</foo>')
+
+    assert c.get('/').body == (
+        b'<html><head>'
+        b'<foo>/bowerstatic/components/jquery/2.1.1/dist/jquery.js</foo>'
+        b'</head><body>Hello!</body></html>')
+
+
+def test_injector_callable_renderer_not_cached():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    nonces = iter(['first', 'second'])
+
+    def render_with_nonce(resource):
+        return '<script nonce="%s" src="%s"></script>' % (
+            next(nonces), resource.url())
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery', render_with_nonce)
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    c = Client(bower.injector(wsgi))
+
+    assert b'nonce="first"' in c.get('/').body
+    assert b'nonce="second"' in c.get('/').body
+    assert len(bower._inclusions_cache) == 0
+
+
+def test_injector_inclusions_cache_disabled():
+    bower = bowerstatic.Bower(inclusions_cache_size=0)
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    Inclusions = bowerstatic.includer.Inclusions
+    with mock.patch.object(Inclusions, 'sorted', autospec=True,
+                           side_effect=Inclusions.sorted) as sort:
+        c.get('/')
+        c.get('/')
+
+    assert sort.call_count == 2
+
+
+def test_injector_streaming():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8'),
+                                  ('Content-Length', '45')])
+        include = components.includer(environ)
+        include('jquery/dist/jquery.js')
+        return [b'<html><head></he', b'ad><body>Hello!', b'</body></html>']
+
+    injector = bower.injector(wsgi, streaming=True)
+
+    c = Client(injector)
+
+    response = c.get('/')
+    expected = (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script></head><body>Hello!</body></html>')
+    assert response.body == expected
+    assert response.content_length == len(expected)
+
+
+def test_injector_streaming_passes_rest_through():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    consumed = []
+    closed = []
+
+    class AppIter(object):
+        def __iter__(self):
+            for chunk in [b'<html><head>', b'</head>', b'<body>',
+                          b'Hello!</body></html>']:
+                consumed.append(chunk)
+                yield chunk
+
+        def close(self):
+            closed.append(True)
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery/dist/jquery.js')
+        return AppIter()
+
+    tween = bowerstatic.InjectorTween(
+        bower, lambda request: request.get_response(wsgi), streaming=True)
+
+    response = tween(webob.Request.blank('/'))
+
+    assert consumed == [b'<html><head>', b'</head>']
+    assert response.content_length is None
+    assert b''.join(response.app_iter) == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script></head><body>Hello!</body></html>')
+    response.app_iter.close()
+    assert closed == [True]
+
+
+def test_injector_streaming_no_head_to_inject():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8'),
+                                  ('Content-Length', '32')])
+        include = components.includer(environ)
+        include('jquery/dist/jquery.js')
+        return [b'<html><body>', b'Hello!</body></html>']
+
+    injector = bower.injector(wsgi, streaming=True)
+
+    c = Client(injector)
+
+    response = c.get('/')
+
+    assert response.body == b'<html><body>Hello!</body></html>'
+    assert response.content_length == 32
+
+
+def test_injector_include_many():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include.many(['jquery-ui', 'jquery', 'jquery'])
+        include.bulk(['jquery-ui'])
+        assert len(environ['bowerstatic.inclusions']._inclusions) == 2
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    response = c.get('/')
+    assert response.body == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script>\n'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js">'
+        b'</script></head><body>Hello!</body></html>')
+
+
+def test_injector_include_many_renderer():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        with mock.patch.object(bowerstatic.core.Resource, 'renderer') as m:
+            include.many(['jquery', 'jquery-ui'], '<foo>{url}</foo>')
+        assert not m.called
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    response = c.get('/')
+    assert response.body == (
+        b'<html><head>'
+        b'<foo>/bowerstatic/components/jquery/2.1.1/dist/jquery.js</foo>\n'
+        b'<foo>/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js'
+        b'</foo></head><body>Hello!</body></html>')
+
+
+def test_injector_include_many_wrong_path():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    environ = {}
+    include = components.includer(environ)
+    with pytest.raises(bowerstatic.Error):
+        include.many(['jquery', 'nonexistent'])
+
+
+def test_include_set():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    with mock.patch.object(bowerstatic.includer.SortedInclusions,
+                           'html', autospec=True) as m:
+        components.include_set('ui', ['jquery-ui-bootstrap'])
+    assert m.call_count == 1
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include.set('ui')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    injector = bower.injector(wsgi)
+
+    c = Client(injector)
+
+    response = c.get('/')
+    assert response.body == (
+        b'<html><head>'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        b'</script>\n'
+        b'<script type="text/javascript" '
+        b'src="/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js">'
+        b'</script>\n'
+        b'<link rel="stylesheet" type="text/css" '
+        b'href="/bowerstatic/components/jquery-ui-bootstrap/0.2.5/'
+        b'jquery.ui.theme.css">'
+        b'</head><body>Hello!</body></html>')
+
+
+def test_include_set_with_other_resources():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    include_set = components.include_set('ui', ['jquery-ui'])
+
+    environ = {}
+    include = components.includer(environ)
+    include('jquery')
+    include('jquery-ui-bootstrap')
+    include.set('ui')
+
+    # resources in the set are only rendered as part of the set
+    assert environ['bowerstatic.inclusions'].render() == (
+        include_set.html() + '\n' +
+        '<link rel="stylesheet" type="text/css" '
+        'href="/bowerstatic/components/jquery-ui-bootstrap/0.2.5/'
+        'jquery.ui.theme.css">')
+
+
+def test_include_sets_overlapping():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    components.include_set('a', ['jquery'])
+    components.include_set('b', ['jquery-ui'])
+
+    environ = {}
+    include = components.includer(environ)
+    include.set('b')
+    include.set('a')
+
+    # jquery is in both sets but is only rendered once
+    assert environ['bowerstatic.inclusions'].render() == (
+        '<script type="text/javascript" '
+        'src="/bowerstatic/components/jquery/2.1.1/dist/jquery.js">'
+        '</script>\n'
+        '<script type="text/javascript" '
+        'src="/bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js">'
+        '</script>')
+
+
+def test_include_set_errors():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    components.include_set('ui', ['jquery-ui'])
+    with pytest.raises(bowerstatic.Error):
+        components.include_set('ui', ['jquery'])
+    with pytest.raises(bowerstatic.Error):
+        components.include_set('other', ['nonexistent'])
+
+    include = components.includer({})
+    with pytest.raises(bowerstatic.Error):
+        include.set('nonexistent')
+
+
+def test_include_set_local_components():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    local = bower.local_components('local', components)
+
+    include_set = components.include_set('ui', ['jquery-ui'])
+
+    environ = {}
+    local.includer(environ).set('ui')
+    assert environ['bowerstatic.inclusions'].render() == include_set.html()
+
+
+def test_include_set_register_renderer():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    include_set = components.include_set('jquery', ['jquery'])
+    bower.register_renderer('.js', '<foo>{url}</foo>')
+    assert include_set.html() == (
+        '<foo>/bowerstatic/components/jquery/2.1.1/dist/jquery.js</foo>')
+
+
+def test_injector_preload():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery-ui-bootstrap')
+        include('jquery/dist/resource.foo')
+        include('jquery/dist/jquery.min.js', bowerstatic.render_inline_js)
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    bower.register_renderer('.foo', '<foo>{url}</foo>')
+
+    c = Client(bower.injector(wsgi, preload=True))
+
+    response = c.get('/')
+    assert response.headers['Link'] == (
+        '</bowerstatic/components/jquery/2.1.1/dist/jquery.js>; '
+        'rel=preload; as=script, '
+        '</bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js>; '
+        'rel=preload; as=script, '
+        '</bowerstatic/components/jquery-ui-bootstrap/0.2.5/'
+        'jquery.ui.theme.css>; rel=preload; as=style')
+
+    bower.register_renderer('.foo', '<foo>{url}</foo>', preload_as='fetch')
+
+    response = c.get('/')
+    assert response.headers['Link'].endswith(
+        '</bowerstatic/components/jquery/2.1.1/dist/resource.foo>; '
+        'rel=preload; as=fetch')
+
+    c = Client(bower.injector(wsgi))
+    response = c.get('/')
+    assert 'Link' not in response.headers
+
+
+def test_injector_preload_inline():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery')
+        include('jquery-ui-bootstrap',
+                '<link rel="stylesheet" href="{url}">')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    bower.register_renderer('.js', bowerstatic.render_inline_js)
+
+    c = Client(bower.injector(wsgi, preload=True))
+
+    # the inlined script is not preloaded, the linked style is
+    assert c.get('/').headers['Link'] == (
+        '</bowerstatic/components/jquery-ui-bootstrap/0.2.5/'
+        'jquery.ui.theme.css>; rel=preload; as=style')
+
+    bower.register_renderer('.js', bowerstatic.renderer.render_js)
+    assert c.get('/').headers['Link'].startswith(
+        '</bowerstatic/components/jquery/2.1.1/dist/jquery.js>; '
+        'rel=preload; as=script')
+
+    bower.register_renderer('.js', lambda resource: '<script></script>',
+                            preload_as=False)
+    assert 'script' not in c.get('/').headers['Link']
+
+
+def test_injector_preload_streaming():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery')
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    c = Client(bower.injector(wsgi, streaming=True, preload=True))
+
+    response = c.get('/')
+    assert response.headers['Link'] == (
+        '</bowerstatic/components/jquery/2.1.1/dist/jquery.js>; '
+        'rel=preload; as=script')
+
+
+def test_injector_preload_nothing_to_preload():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html;charset=UTF-8')])
+        include = components.includer(environ)
+        include('jquery', bowerstatic.render_inline_js)
+        return [b'<html><head></head><body>Hello!</body></html>']
+
+    c = Client(bower.injector(wsgi, preload=True))
+
+    response = c.get('/')
+    assert 'Link' not in response.headers
+
+
+def test_include_set_preload():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    components.include_set('ui', ['jquery-ui'])
+
+    environ = {}
+    components.includer(environ).set('ui')
+    assert environ['bowerstatic.inclusions'].link_header() == (
+        '</bowerstatic/components/jquery/2.1.1/dist/jquery.js>; '
+        'rel=preload; as=script, '
+        '</bowerstatic/components/jquery-ui/1.10.4/ui/jquery-ui.js>; '
+        'rel=preload; as=script')
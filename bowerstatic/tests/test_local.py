@@ -3,11 +3,14 @@ from webtest import TestApp as Client
 import os
 import sys
 import json
+import mock
+import time
 from datetime import datetime, timedelta
 import pytest
 
 from bowerstatic import compat
 from bowerstatic import filesystem_microsecond_autoversion
+from bowerstatic import content_hash_autoversion
 
 
 def test_local_falls_back_to_components():
@@ -396,3 +399,267 @@ def test_local_with_second_auto_version(tmpdir):
     response = c.get('/bowerstatic/local/component/%s/main.js' %
                      url_dt_str)
     assert response.body == b'/* this is main.js, modified */'
+
+
+def counting_autoversion():
+    calls = []
+
+    def autoversion(path):
+        calls.append(path)
+        return 'v%s' % len(calls)
+    return calls, autoversion
+
+
+def test_local_autoversion_not_cached_by_default():
+    calls, autoversion = counting_autoversion()
+    bower = bowerstatic.Bower(autoversion=autoversion)
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    component = local.component(os.path.join(
+        os.path.dirname(__file__), 'local_component'), version=None)
+
+    assert component.version == 'v1'
+    assert component.version == 'v2'
+
+
+def test_local_autoversion_explicit_invalidation():
+    calls, autoversion = counting_autoversion()
+    bower = bowerstatic.Bower(
+        autoversion=autoversion,
+        autoversion_invalidation=bowerstatic.ExplicitInvalidation())
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    path = os.path.join(os.path.dirname(__file__), 'local_component')
+    component = local.component(path, version=None)
+
+    assert component.version == 'v1'
+    assert component.version == 'v1'
+    assert component.url() == '/bowerstatic/local/local_component/v1/'
+    assert len(calls) == 1
+
+    bower.invalidate(path)
+    assert component.version == 'v2'
+
+    bower.invalidate()
+    assert component.version == 'v3'
+    assert component.version == 'v3'
+
+
+def test_local_autoversion_ttl_invalidation(monkeypatch):
+    calls, autoversion = counting_autoversion()
+    bower = bowerstatic.Bower(
+        autoversion=autoversion,
+        autoversion_invalidation=bowerstatic.TTLInvalidation(10))
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    component = local.component(os.path.join(
+        os.path.dirname(__file__), 'local_component'), version=None)
+
+    now = [1000.0]
+    monkeypatch.setattr('bowerstatic.autoversion.time.time', lambda: now[0])
+
+    assert component.version == 'v1'
+    now[0] += 9
+    assert component.version == 'v1'
+    now[0] += 2
+    assert component.version == 'v2'
+    assert component.version == 'v2'
+
+
+def make_watched_component(tmpdir, watcher):
+    calls, autoversion = counting_autoversion()
+    bower = bowerstatic.Bower(autoversion=autoversion,
+                              autoversion_invalidation=watcher)
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    component_dir = tmpdir.mkdir('component')
+    component_dir.join('bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': 'main.js',
+    }))
+    main_js = component_dir.join('main.js')
+    main_js.write('/* this is main.js */')
+    component = local.component(component_dir.strpath, version=None)
+    return bower, component, main_js, calls
+
+
+def test_local_autoversion_polling_watcher(tmpdir):
+    watcher = bowerstatic.PollingWatcher(interval=3600)
+    bower, component, main_js, calls = make_watched_component(tmpdir, watcher)
+
+    assert component.version == 'v1'
+    assert component.version == 'v1'
+
+    # nothing changed
+    watcher.check()
+    assert component.version == 'v1'
+    assert len(calls) == 1
+
+    main_js.setmtime(main_js.mtime() + 10)
+    watcher.check()
+    assert len(calls) == 2
+    assert component.version == 'v2'
+
+    main_js.dirpath().join('other.js').write('/* this is other.js */')
+    watcher.check()
+    assert component.version == 'v3'
+
+    bower.close()
+
+
+def test_local_autoversion_polling_watcher_thread(tmpdir):
+    watcher = bowerstatic.PollingWatcher(interval=0.01)
+    bower, component, main_js, calls = make_watched_component(tmpdir, watcher)
+
+    assert component.version == 'v1'
+    assert watcher._thread.is_alive()
+
+    main_js.setmtime(main_js.mtime() + 10)
+    for i in range(500):
+        if component.version != 'v1':
+            break
+        time.sleep(0.01)
+    assert component.version == 'v2'
+
+    bower.close()
+    assert not watcher._thread.is_alive()
+
+
+def test_local_with_content_hash_auto_version(tmpdir):
+    component_dir = tmpdir.mkdir('component')
+    component_dir.join('bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',  # should be ignored
+        'main': 'main.js'
+    }))
+    main_js_file = component_dir.join('main.js')
+    main_js_file.write('/* this is main.js */')
+
+    bower = bowerstatic.Bower(autoversion=content_hash_autoversion)
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    local = bower.local_components('local', components)
+
+    component = local.component(component_dir.strpath, version=None)
+
+    version = component.version
+    assert version != '2.1'
+
+    c = Client(bower.publisher(None))
+    response = c.get('/bowerstatic/local/component/%s/main.js' % version)
+    assert response.body == b'/* this is main.js */'
+
+    # touching a file does not change the version
+    main_js_file.setmtime(main_js_file.mtime() + 10)
+    assert component.version == version
+
+    # the same content elsewhere gets the same version
+    other_dir = tmpdir.mkdir('other')
+    component_dir.copy(other_dir)
+    assert content_hash_autoversion(other_dir.strpath) == version
+
+    # changing content does
+    main_js_file.write('/* this is main.js, modified */')
+    modified_version = component.version
+    assert modified_version != version
+
+    # and so does adding a file
+    component_dir.join('extra.js').write('/* extra */')
+    assert component.version != modified_version
+
+
+def test_content_hash_autoversion_reuses_hashes(tmpdir):
+    tmpdir.join('a.js').write('a')
+    tmpdir.join('b.js').write('b')
+
+    content_hash_autoversion(tmpdir.strpath)
+
+    with mock.patch('bowerstatic.autoversion.open', create=True) as m:
+        content_hash_autoversion(tmpdir.strpath)
+    assert not m.called
+
+
+def test_content_hash_autoversion_invalidate(tmpdir):
+    component_dir = tmpdir.mkdir('component')
+    component_dir.join('bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': 'main.js'
+    }))
+    main_js_file = component_dir.join('main.js')
+    main_js_file.write('/* aaa */')
+
+    bower = bowerstatic.Bower(autoversion=content_hash_autoversion)
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    local = bower.local_components('local', components)
+    component = local.component(component_dir.strpath, version=None)
+    version = component.version
+
+    # the content changes but the stat information stays the same
+    stat = os.stat(main_js_file.strpath)
+    main_js_file.write('/* bbb */')
+    os.utime(main_js_file.strpath, (stat.st_atime, stat.st_mtime))
+    assert component.version == version
+
+    bower.invalidate()
+    assert component.version != version
+
+
+def test_invalidate_path_only_forgets_component(tmpdir):
+    component_dir = tmpdir.mkdir('component')
+    component_dir.join('bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': 'main.js'
+    }))
+    main_js_file = component_dir.join('main.js')
+    main_js_file.write('/* aaa */')
+    other_dir = tmpdir.mkdir('other')
+    other_dir.join('other.js').write('/* other */')
+
+    bower = bowerstatic.Bower(
+        autoversion=content_hash_autoversion,
+        autoversion_invalidation=bowerstatic.ExplicitInvalidation())
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    local = bower.local_components('local', components)
+    component = local.component(component_dir.strpath, version=None)
+    version = component.version
+    content_hash_autoversion(other_dir.strpath)
+
+    c = Client(bower.publisher(None))
+    c.get('/bowerstatic/local/component/%s/main.js' % version)
+    assert len(bower._file_info) == 1
+
+    # the content changes but the stat information stays the same
+    stat = os.stat(main_js_file.strpath)
+    main_js_file.write('/* bbb */')
+    os.utime(main_js_file.strpath, (stat.st_atime, stat.st_mtime))
+
+    bower.invalidate(component_dir.strpath)
+    assert component.version != version
+    # other cached information is kept
+    assert len(bower._file_info) == 1
+    with mock.patch('bowerstatic.autoversion.open', create=True) as m:
+        content_hash_autoversion(other_dir.strpath)
+    assert not m.called
@@ -1,7 +1,15 @@
 import bowerstatic
 from webtest import TestApp as Client
 import os
+import stat
 import pytest
+import webob
+import webob.static
+import gzip
+import io
+import json
+import mimetypes
+import mock
 from bowerstatic.publisher import FOREVER
 from datetime import datetime, timedelta
 
@@ -99,6 +107,537 @@ def test_different_publisher_signature():
     assert response.body == b'/* jquery.js 2.1.1 */\n'
 
 
+def test_publisher_routes():
+    bower = bowerstatic.Bower()
+    bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    c = Client(bower.publisher(None))
+
+    c.get('/bowerstatic/components/jquery/2.1.1/dist/jquery.js')
+    component = bower._routes[('components', 'jquery', '2.1.1')]
+    assert component.name == 'jquery'
+
+    # a hit does not look up the component again
+    with mock.patch.object(bowerstatic.core.ComponentCollection,
+                           'get_component') as m:
+        response = c.get(
+            '/bowerstatic/components/jquery/2.1.1/dist/jquery.js')
+        c.get('/bowerstatic/components/jquery/2.1.1/../../publisher.py',
+              status=404)
+    assert not m.called
+    assert response.body == b'/* jquery.js 2.1.1 */\n'
+
+    # misses are not remembered
+    c.get('/bowerstatic/components/jquery/2.0/dist/jquery.js', status=404)
+    assert ('components', 'jquery', '2.0') not in bower._routes
+
+    bower.invalidate()
+    assert not bower._routes
+
+
+def test_publisher_routes_forget_replaced_component():
+    bower = bowerstatic.Bower()
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+    local = bower.local_components('local', components)
+    c = Client(bower.publisher(None))
+
+    c.get('/bowerstatic/local/jquery/2.1.1/dist/jquery.js')
+    assert ('local', 'jquery', '2.1.1') in bower._routes
+
+    local.component(os.path.join(
+        os.path.dirname(__file__), 'local_component'), version='2.0')
+    assert ('local', 'jquery', '2.1.1') in bower._routes
+    jquery = components.get_component('jquery')
+    local.add(bowerstatic.core.Component(
+        bower, local, jquery.path, 'jquery', '3.0', jquery.main,
+        jquery.dependencies, False))
+    assert ('local', 'jquery', '2.1.1') not in bower._routes
+    c.get('/bowerstatic/local/jquery/2.1.1/dist/jquery.js', status=404)
+    c.get('/bowerstatic/local/jquery/3.0/dist/jquery.js')
+
+
 def test_create_directory_with_name_twice():
     # XXX
     pass
+
+
+def make_file_cache_client(tmpdir, file_cache):
+    bower_components_dir = tmpdir.mkdir('bower_components')
+    component_dir = bower_components_dir.mkdir('component')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': 'main.js'
+    }))
+    component_dir.join('main.js').write('/* this is main.js */')
+    component_dir.join('big.js').write('/* this is big.js */' * 100)
+
+    bower = bowerstatic.Bower(file_cache=file_cache)
+
+    bower.components('components', bower_components_dir.strpath)
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'Hello!']
+
+    return component_dir, Client(bower.publisher(wsgi))
+
+
+def test_publisher_file_cache(tmpdir):
+    file_cache = bowerstatic.FileCache()
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js')
+    assert response.body == b'/* this is main.js */'
+    assert response.content_type == mimetypes.guess_type('main.js')[0]
+    assert response.content_length == len(b'/* this is main.js */')
+    assert response.cache_control.max_age == FOREVER
+    assert response.etag is not None
+    assert file_cache.stats()['misses'] == 1
+
+    with mock.patch('bowerstatic.cache.open', create=True) as m:
+        response = c.get('/bowerstatic/components/component/2.1/main.js')
+    assert not m.called
+    assert response.body == b'/* this is main.js */'
+    assert file_cache.stats()['hits'] == 1
+    assert file_cache.stats()['entries'] == 1
+
+    c.get('/bowerstatic/components/component/2.1/main.js',
+          headers={'If-None-Match': '"%s"' % response.etag}, status=304)
+
+
+def test_publisher_file_cache_validates_mtime(tmpdir):
+    file_cache = bowerstatic.FileCache()
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js')
+    assert response.body == b'/* this is main.js */'
+
+    main_js = component_dir.join('main.js')
+    main_js.write('/* this is main.js, modified */')
+    main_js.setmtime(main_js.mtime() + 10)
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js')
+    assert response.body == b'/* this is main.js, modified */'
+
+
+def test_publisher_file_cache_max_entry_size(tmpdir):
+    file_cache = bowerstatic.FileCache(max_entry_size=100)
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    response = c.get('/bowerstatic/components/component/2.1/big.js')
+    assert response.body == b'/* this is big.js */' * 100
+    assert response.cache_control.max_age == FOREVER
+    assert file_cache.stats()['entries'] == 0
+
+    # the cache remembers that the file is too big without opening it
+    with mock.patch('bowerstatic.cache.open', create=True) as m:
+        response = c.get('/bowerstatic/components/component/2.1/big.js')
+    assert not m.called
+    assert response.body == b'/* this is big.js */' * 100
+
+    # until it changes
+    big_js = component_dir.join('big.js')
+    big_js.write('/* small */')
+    big_js.setmtime(big_js.mtime() + 10)
+    response = c.get('/bowerstatic/components/component/2.1/big.js')
+    assert response.body == b'/* small */'
+    assert file_cache.stats()['entries'] == 1
+
+
+def test_publisher_file_cache_evicts(tmpdir):
+    file_cache = bowerstatic.FileCache(max_size=2010)
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    c.get('/bowerstatic/components/component/2.1/main.js')
+    c.get('/bowerstatic/components/component/2.1/big.js')
+    stats = file_cache.stats()
+    assert stats['entries'] == 1
+    assert stats['size'] == 2000
+    assert stats['evictions'] == 1
+
+
+def test_publisher_file_cache_404(tmpdir):
+    file_cache = bowerstatic.FileCache()
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    c.get('/bowerstatic/components/component/2.1/nonexistent.js',
+          status=404)
+
+
+def test_publisher_immutable(c):
+    response = c.get(
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.js')
+    assert response.headers['Cache-Control'] == (
+        'max-age=%s, immutable' % FOREVER)
+    assert response.etag is not None
+    assert response.last_modified is not None
+
+
+@pytest.mark.parametrize('file_cache', [None, bowerstatic.FileCache()])
+def test_publisher_not_modified_from_memory(tmpdir, file_cache):
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js')
+    etag = response.etag
+    last_modified = response.headers['Last-Modified']
+
+    with mock.patch('bowerstatic.publisher.os') as m:
+        with mock.patch('bowerstatic.cache.os') as cache_m:
+            response = c.get(
+                '/bowerstatic/components/component/2.1/main.js',
+                headers={'If-None-Match': '"%s"' % etag}, status=304)
+            c.get('/bowerstatic/components/component/2.1/main.js',
+                  headers={'If-Modified-Since': last_modified}, status=304)
+    assert not m.stat.called
+    assert not cache_m.stat.called
+    assert response.etag == etag
+    assert response.headers['Cache-Control'] == (
+        'max-age=%s, immutable' % FOREVER)
+    assert response.body == b''
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js',
+                     headers={'If-None-Match': '"other"'})
+    assert response.body == b'/* this is main.js */'
+
+
+def test_publisher_not_modified_before_first_request(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+
+    response = c.get('/bowerstatic/components/component/2.1/main.js')
+    bower = c.app.tween.bower
+    bower.invalidate()
+    assert len(bower._file_info) == 0
+
+    c.get('/bowerstatic/components/component/2.1/main.js',
+          headers={'If-None-Match': '"%s"' % response.etag}, status=304)
+
+
+def test_publisher_method_not_allowed(c):
+    c.post('/bowerstatic/components/jquery/2.1.1/dist/jquery.js',
+           status=405)
+
+
+def test_publisher_mmap(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+
+    with mock.patch('bowerstatic.publisher.MMAP_MIN_SIZE', 100):
+        with mock.patch('bowerstatic.publisher.MmapIter',
+                        wraps=bowerstatic.publisher.MmapIter) as m:
+            response = c.get('/bowerstatic/components/component/2.1/big.js')
+            assert response.body == b'/* this is big.js */' * 100
+            assert response.content_length == 2000
+            assert m.call_count == 1
+
+            response = c.get('/bowerstatic/components/component/2.1/big.js',
+                             headers={'Range': 'bytes=10-19'}, status=206)
+            assert response.body == b' big.js */'
+
+            response = c.get(
+                '/bowerstatic/components/component/2.1/main.js')
+            assert response.body == b'/* this is main.js */'
+            assert m.call_count == 2
+
+
+def test_publisher_file_wrapper(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append(f.name)
+        return webob.static.FileIter(f)
+
+    with mock.patch('bowerstatic.publisher.MMAP_MIN_SIZE', 100):
+        response = c.get('/bowerstatic/components/component/2.1/big.js',
+                         extra_environ={'wsgi.file_wrapper': file_wrapper})
+    assert response.body == b'/* this is big.js */' * 100
+    assert wrapped == [component_dir.join('big.js').strpath]
+
+
+def test_mmap_iter(tmpdir):
+    path = tmpdir.join('data')
+    path.write(b'0123456789' * 10, mode='wb')
+    app_iter = bowerstatic.publisher.MmapIter(open(path.strpath, 'rb'),
+                                              block_size=30)
+    assert list(app_iter) == [b'0123456789' * 3] * 3 + [b'0123456789']
+    assert b''.join(app_iter.app_iter_range(95, 200)) == b'56789'
+    assert b''.join(app_iter.app_iter_range(5, 8)) == b'567'
+    app_iter.close()
+    assert app_iter.file.closed
+
+
+BIG_JS = b'/* this is big.js */' * 100
+
+
+@pytest.mark.parametrize('file_cache,mmap_min_size', [
+    (None, 1024 * 1024),
+    (None, 100),
+    (bowerstatic.FileCache(), 1024 * 1024),
+])
+def test_publisher_range(tmpdir, file_cache, mmap_min_size):
+    component_dir, c = make_file_cache_client(tmpdir, file_cache)
+    url = '/bowerstatic/components/component/2.1/big.js'
+
+    with mock.patch('bowerstatic.publisher.MMAP_MIN_SIZE', mmap_min_size):
+        response = c.get(url, headers={'Range': 'bytes=20-39'}, status=206)
+        assert response.body == BIG_JS[20:40]
+        assert response.headers['Content-Range'] == 'bytes 20-39/2000'
+        assert response.content_length == 20
+        assert response.content_type == mimetypes.guess_type(url)[0]
+        assert response.etag is not None
+
+        response = c.get(url, headers={'Range': 'bytes=1990-'}, status=206)
+        assert response.body == BIG_JS[1990:]
+
+        response = c.get(url, headers={'Range': 'bytes=-5'}, status=206)
+        assert response.body == BIG_JS[-5:]
+        assert response.headers['Content-Range'] == 'bytes 1995-1999/2000'
+
+        response = c.get(url, headers={'Range': 'bytes=1990-3000'},
+                         status=206)
+        assert response.body == BIG_JS[1990:]
+
+
+def test_publisher_multiple_ranges(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+    url = '/bowerstatic/components/component/2.1/big.js'
+
+    response = c.get(url, headers={'Range': 'bytes=0-9, 1990-'},
+                     status=206)
+    content_type, params = response.headers['Content-Type'].split('; ')
+    assert content_type == 'multipart/byteranges'
+    boundary = params[len('boundary='):]
+    js_type = mimetypes.guess_type(url)[0]
+    assert response.body == (
+        b'\r\n--' + boundary.encode('ascii') + b'\r\n'
+        b'Content-Type: ' + js_type.encode('ascii') + b'\r\n'
+        b'Content-Range: bytes 0-9/2000\r\n\r\n' + BIG_JS[:10] +
+        b'\r\n--' + boundary.encode('ascii') + b'\r\n'
+        b'Content-Type: ' + js_type.encode('ascii') + b'\r\n'
+        b'Content-Range: bytes 1990-1999/2000\r\n\r\n' + BIG_JS[1990:] +
+        b'\r\n--' + boundary.encode('ascii') + b'--\r\n')
+    assert response.content_length == len(response.body)
+
+
+def test_publisher_range_not_satisfiable(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+    url = '/bowerstatic/components/component/2.1/big.js'
+
+    response = c.get(url, headers={'Range': 'bytes=2000-'}, status=416)
+    assert response.headers['Content-Range'] == 'bytes */2000'
+
+
+def test_publisher_invalid_range(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+    url = '/bowerstatic/components/component/2.1/big.js'
+
+    for header in ['bytes=20-10', 'bytes=foo', 'items=0-10',
+                   'bytes=' + ','.join(['0-1'] * 20)]:
+        response = c.get(url, headers={'Range': header}, status=200)
+        assert response.body == BIG_JS
+
+
+def test_publisher_if_range(tmpdir):
+    component_dir, c = make_file_cache_client(tmpdir, None)
+    url = '/bowerstatic/components/component/2.1/big.js'
+
+    response = c.get(url)
+    etag = response.etag
+    last_modified = response.headers['Last-Modified']
+
+    response = c.get(url, headers={'Range': 'bytes=0-9',
+                                   'If-Range': '"%s"' % etag}, status=206)
+    assert response.body == BIG_JS[:10]
+    response = c.get(url, headers={'Range': 'bytes=0-9',
+                                   'If-Range': last_modified}, status=206)
+    assert response.body == BIG_JS[:10]
+
+    response = c.get(url, headers={'Range': 'bytes=0-9',
+                                   'If-Range': '"other"'}, status=200)
+    assert response.body == BIG_JS
+    response = c.get(url, headers={'Range': 'bytes=0-9',
+                                   'If-Range': 'W/"%s"' % etag}, status=200)
+    assert response.body == BIG_JS
+
+
+def make_compressor_client(tmpdir, compressor, file_cache=None):
+    bower_components_dir = tmpdir.mkdir('bower_components')
+    component_dir = bower_components_dir.mkdir('component')
+    component_dir.join('.bower.json').write(json.dumps({
+        'name': 'component',
+        'version': '2.1',
+        'main': 'main.js'
+    }))
+    component_dir.join('main.js').write('/* this is main.js */')
+    component_dir.join('main.js.gz').write_binary(
+        gzip_bytes(b'/* this is main.js */'))
+    component_dir.join('big.js').write('/* this is big.js */' * 100)
+    component_dir.join('image.png').write_binary(b'PNG' * 100)
+
+    bower = bowerstatic.Bower(compressor=compressor, file_cache=file_cache)
+
+    bower.components('components', bower_components_dir.strpath)
+
+    def wsgi(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'Hello!']
+
+    publisher = bower.publisher(wsgi)
+
+    # not using webtest as it decodes compressed responses
+    def get(path, headers=None, method='GET'):
+        return webob.Request.blank(path, headers=headers,
+                                   method=method).get_response(publisher)
+
+    return component_dir, get
+
+
+def gzip_bytes(data):
+    f = io.BytesIO()
+    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+        g.write(data)
+    return f.getvalue()
+
+
+def gunzip_bytes(data):
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as g:
+        return g.read()
+
+
+@pytest.mark.parametrize('file_cache', [None, bowerstatic.FileCache()])
+def test_publisher_precompressed_sibling(tmpdir, file_cache):
+    component_dir, get = make_compressor_client(
+        tmpdir, bowerstatic.Compressor(), file_cache)
+
+    response = get('/bowerstatic/components/component/2.1/main.js',
+                   headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.content_encoding == 'gzip'
+    assert response.content_type == mimetypes.guess_type('main.js')[0]
+    assert response.vary == ('Accept-Encoding',)
+    assert response.cache_control.max_age == FOREVER
+    assert gunzip_bytes(response.body) == b'/* this is main.js */'
+
+    response = get('/bowerstatic/components/component/2.1/main.js')
+    assert response.content_encoding is None
+    assert response.vary == ('Accept-Encoding',)
+    assert response.body == b'/* this is main.js */'
+
+
+def test_publisher_compress_on_the_fly(tmpdir):
+    compressor = bowerstatic.Compressor()
+    component_dir, get = make_compressor_client(tmpdir, compressor)
+
+    response = get('/bowerstatic/components/component/2.1/big.js',
+                   headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding == 'gzip'
+    assert response.vary == ('Accept-Encoding',)
+    assert gunzip_bytes(response.body) == b'/* this is big.js */' * 100
+    etag = response.etag
+
+    response = get('/bowerstatic/components/component/2.1/big.js',
+                   headers={'Accept-Encoding': 'gzip'})
+    assert compressor._cache.stats()['hits'] == 1
+    assert response.etag == etag
+
+    response = get('/bowerstatic/components/component/2.1/big.js',
+                   headers={'Accept-Encoding': 'gzip;q=0'})
+    assert response.content_encoding is None
+    assert response.body == b'/* this is big.js */' * 100
+
+
+def test_publisher_compress_on_the_fly_cache_dir(tmpdir):
+    cache_dir = tmpdir.mkdir('compressed')
+    compressor = bowerstatic.Compressor(cache_dir=cache_dir.strpath)
+    component_dir, get = make_compressor_client(tmpdir, compressor)
+
+    response = get('/bowerstatic/components/component/2.1/big.js',
+                   headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding == 'gzip'
+    assert gunzip_bytes(response.body) == b'/* this is big.js */' * 100
+    assert len(cache_dir.listdir()) == 1
+    assert cache_dir.listdir()[0].ext == '.gz'
+    assert stat.S_IMODE(os.stat(cache_dir.listdir()[0].strpath).st_mode) == (
+        0o644)
+
+
+def test_publisher_compress_skips_small_and_binary_files(tmpdir):
+    compressor = bowerstatic.Compressor(compress=True)
+    component_dir, get = make_compressor_client(tmpdir, compressor)
+
+    component_dir.join('small.js').write('/* small */')
+    response = get('/bowerstatic/components/component/2.1/small.js',
+                   headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding is None
+    assert response.body == b'/* small */'
+
+    response = get('/bowerstatic/components/component/2.1/image.png',
+                   headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding is None
+    assert response.vary is None
+    assert response.body == b'PNG' * 100
+
+
+def test_encoding_qualities():
+    from bowerstatic.compress import encoding_qualities
+    assert encoding_qualities('gzip, br;q=0.5') == {'gzip': 1.0, 'br': 0.5}
+    assert encoding_qualities('br;q=0.2, *;q=0.5') == {
+        '*': 0.5, 'br': 0.2, 'gzip': 0.5}
+
+
+def test_publisher_compress_quality(tmpdir):
+    compressor = bowerstatic.Compressor(compress=False)
+    component_dir, get = make_compressor_client(tmpdir, compressor)
+    component_dir.join('main.js.br').write_binary(b'brotli')
+
+    def encoding(accept_encoding):
+        return get('/bowerstatic/components/component/2.1/main.js',
+                   headers={'Accept-Encoding': accept_encoding}
+                   ).content_encoding
+
+    # without a preference of the client we prefer br
+    assert encoding('gzip, br') == 'br'
+    assert encoding('gzip, br;q=0.5') == 'gzip'
+    assert encoding('gzip;q=0.5, br') == 'br'
+    assert encoding('gzip;q=0, *') == 'br'
+    assert encoding('br;q=0, *') == 'gzip'
+    assert encoding('br;q=0, gzip;q=0, *') is None
+
+
+def test_publisher_compress_method_not_allowed(tmpdir):
+    component_dir, get = make_compressor_client(
+        tmpdir, bowerstatic.Compressor())
+
+    # the precompressed sibling and the file compressed in memory
+    for path in ['main.js', 'big.js']:
+        response = get('/bowerstatic/components/component/2.1/' + path,
+                       headers={'Accept-Encoding': 'gzip'}, method='POST')
+        assert response.status_int == 405
+
+
+def test_publisher_compress_not_modified_without_stat(tmpdir):
+    component_dir, get = make_compressor_client(
+        tmpdir, bowerstatic.Compressor())
+    component_dir.join('small.js').write('/* small */')
+
+    # a precompressed sibling, compressed in memory, and too small
+    for path in ['main.js', 'big.js', 'small.js']:
+        url = '/bowerstatic/components/component/2.1/' + path
+        response = get(url, headers={'Accept-Encoding': 'gzip'})
+        etag = response.etag
+        with mock.patch('os.stat', wraps=os.stat) as m:
+            response = get(url, headers={'Accept-Encoding': 'gzip',
+                                         'If-None-Match': '"%s"' % etag})
+        assert response.status_int == 304
+        assert response.vary == ('Accept-Encoding',)
+        assert not [call for call in m.call_args_list
+                    if component_dir.strpath in str(call)]
+
+
+def test_publisher_compress_on_the_fly_refused(tmpdir):
+    compressor = bowerstatic.Compressor()
+    component_dir, get = make_compressor_client(tmpdir, compressor)
+
+    response = get('/bowerstatic/components/component/2.1/big.js',
+                   headers={'Accept-Encoding': 'gzip;q=0, *'})
+    assert response.content_encoding != 'gzip'
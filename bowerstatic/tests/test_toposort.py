@@ -0,0 +1,53 @@
+import pytest
+import os
+import bowerstatic
+from bowerstatic.includer import ResourceInclusion
+from bowerstatic.toposort import topological_sort, TopologicalSortError
+
+
+def test_topological_sort():
+    depends = {
+        'a': [],
+        'b': ['a'],
+        'c': ['b', 'a'],
+        'd': [],
+    }
+    assert topological_sort(['d', 'c'], depends.get) == ['d', 'a', 'b', 'c']
+    assert topological_sort(['c', 'd', 'b'], depends.get) == [
+        'a', 'b', 'c', 'd']
+
+
+def test_topological_sort_deep():
+    count = 10000
+    depends = {i: [i - 1] if i else [] for i in range(count)}
+    assert topological_sort([count - 1], depends.get) == list(range(count))
+
+
+def test_topological_sort_cycle():
+    depends = {
+        'a': ['b'],
+        'b': ['c'],
+        'c': ['a'],
+    }
+    with pytest.raises(TopologicalSortError) as excinfo:
+        topological_sort(['a'], depends.get)
+    assert excinfo.value.cycle == ['a', 'b', 'c', 'a']
+    assert str(excinfo.value) == 'Not a DAG: a -> b -> c -> a'
+
+
+def test_topological_sort_cycle_inclusions():
+    bower = bowerstatic.Bower()
+
+    components = bower.components('components', os.path.join(
+        os.path.dirname(__file__), 'bower_components'))
+
+    a = ResourceInclusion(components.resources('jquery')[0])
+    with pytest.raises(TopologicalSortError) as excinfo:
+        topological_sort([a], lambda inclusion: [a])
+    assert excinfo.value.cycle == [a, a]
+    assert str(excinfo.value) == (
+        'Not a DAG: '
+        '<bowerstatic.includer.ResourceInclusion for '
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.js> -> '
+        '<bowerstatic.includer.ResourceInclusion for '
+        '/bowerstatic/components/jquery/2.1.1/dist/jquery.js>')
@@ -1,22 +1,45 @@
 class TopologicalSortError(Exception):
-    pass
+    """There is a cycle in the dependencies.
 
+    ``cycle`` is the list of nodes in the cycle, starting and ending
+    with the same node.
+    """
+    def __init__(self, cycle):
+        super(TopologicalSortError, self).__init__(
+            "Not a DAG: %s" % ' -> '.join([str(n) for n in cycle]))
+        self.cycle = cycle
 
-def topological_sort(l, get_depends):
+
+def topological_sort(nodes, get_depends):
+    """Sort nodes so that each comes after its dependencies.
+
+    Dependencies that are not in nodes are included too. Nodes are in the
+    given order as far as the dependencies allow. This does not recurse,
+    so it can handle long chains of dependencies.
+    """
     result = []
     marked = set()
-    temporary_marked = set()
-
-    def visit(n):
-        if n in marked:
-            return
-        if n in temporary_marked:
-            raise TopologicalSortError("Not a DAG")
-        temporary_marked.add(n)
-        for m in get_depends(n):
-            visit(m)
-        marked.add(n)
-        result.append(n)
-    for n in l:
-        visit(n)
+    for root in nodes:
+        if root in marked:
+            continue
+        # the nodes we are visiting, with their position in path
+        path = [root]
+        on_path = {root: 0}
+        stack = [iter(get_depends(root))]
+        while stack:
+            for m in stack[-1]:
+                if m in marked:
+                    continue
+                if m in on_path:
+                    raise TopologicalSortError(path[on_path[m]:] + [m])
+                on_path[m] = len(path)
+                path.append(m)
+                stack.append(iter(get_depends(m)))
+                break
+            else:
+                stack.pop()
+                n = path.pop()
+                del on_path[n]
+                marked.add(n)
+                result.append(n)
     return result
@@ -1,5 +1,6 @@
 import os
 import inspect
+import tempfile
 
 
 def module_relative_path(path):
@@ -11,3 +12,23 @@ def module_relative_path(path):
     calling_file = inspect.stack()[1][1]
     calling_dir = os.path.abspath(os.path.dirname(calling_file))
     return os.path.join(calling_dir, path)
+
+
+def write_atomic(path, data):
+    """Write the bytes data to the file at path.
+
+    The data is written to a temporary file first, so that other
+    processes never read a partially written file. The file is readable
+    by everybody, so that processes of other users can read it too.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp makes files only their owner can read
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
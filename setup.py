@@ -33,5 +33,10 @@ setup(
     tests_require=tests_require,
     extras_require=dict(
         test=tests_require,
-    )
+    ),
+    entry_points={
+        'console_scripts': [
+            'bowerstatic-collect = bowerstatic.export:main',
+        ]
+    },
 )